@@ -0,0 +1,31 @@
+"""
+Standalone multi-worker API.
+
+Serves /users/{account_code}, /users/batch and /user/exists from the
+member_roles snapshots published by a bot process running with
+RUN_MODE=bot, so no Discord connection is needed and uvicorn can run
+several worker processes.
+"""
+import os
+
+# Must be set before bot is imported, here and in every worker process
+os.environ['RUN_MODE'] = 'api'
+
+import uvicorn
+
+import bot
+
+if __name__ == "__main__":
+    bot.setup_database()
+    uvicorn.run(
+        "bot:app",
+        host="0.0.0.0",
+        port=int(os.getenv('PORT', '8000')),
+        workers=int(os.getenv('API_WORKERS', '4')),
+        ssl_keyfile=os.getenv('SSL_KEYFILE'),
+        ssl_certfile=os.getenv('SSL_CERTFILE'),
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1'),
+        # Workers import bot, whose root queue handler then takes uvicorn's records
+        log_config=None
+    )
@@ -0,0 +1,99 @@
+"""
+Compares the legacy users layout (155-character TEXT key, UNIQUE plus a
+duplicate idx_account_id index) with the account_hash layout on a synthetic
+table: database file size and point lookup latency.
+
+Usage: python benchmarks/bench_account_key.py [--rows 1000000] [--lookups 100000]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+LEGACY_SCHEMA = '''
+    CREATE TABLE users (
+        discord_id TEXT PRIMARY KEY,
+        account_id TEXT UNIQUE,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+def synthetic_code():
+    return base64.urlsafe_b64encode(os.urandom(117)).decode()[:155]
+
+def build(path, rows, legacy):
+    conn = sqlite3.connect(path)
+    if legacy:
+        conn.execute(LEGACY_SCHEMA)
+        conn.execute('CREATE INDEX idx_account_id ON users(account_id)')
+    else:
+        conn.execute(bot.USERS_TABLE_SCHEMA.format(table='users'))
+    sample = []
+    batch = []
+    for i in range(rows):
+        code = synthetic_code()
+        if i % max(rows // 10000, 1) == 0:
+            sample.append(code)
+        if legacy:
+            batch.append((str(10**17 + i), code))
+        else:
+            batch.append((str(10**17 + i), bot.account_digest(code), code))
+        if len(batch) == 50000:
+            insert(conn, batch, legacy)
+            batch = []
+    insert(conn, batch, legacy)
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+    return sample
+
+def insert(conn, batch, legacy):
+    if legacy:
+        conn.executemany('INSERT INTO users (discord_id, account_id) VALUES (?, ?)', batch)
+    else:
+        conn.executemany(bot.SQL_INSERT_USER, batch)
+
+def measure(path, sample, lookups, legacy):
+    conn = sqlite3.connect(path)
+    probes = [random.choice(sample) if i % 2 else synthetic_code() for i in range(lookups)]
+    start = time.perf_counter()
+    for code in probes:
+        if legacy:
+            conn.execute('SELECT discord_id FROM users WHERE account_id = ?', (code,)).fetchone()
+        else:
+            conn.execute(bot.SQL_DISCORD_ID_BY_ACCOUNT, (bot.account_digest(code),)).fetchone()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return {
+        "layout": "legacy_text_key" if legacy else "account_hash",
+        "db_size_mb": round(os.path.getsize(path) / 1024 / 1024, 1),
+        "lookups": lookups,
+        "per_lookup_us": round(elapsed / lookups * 1e6, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_account_key_')
+    results = []
+    for legacy in (True, False):
+        path = os.path.join(workdir, 'legacy.db' if legacy else 'account_hash.db')
+        sample = build(path, args.rows, legacy)
+        results.append(measure(path, sample, args.lookups, legacy))
+    print(json.dumps({"rows": args.rows, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
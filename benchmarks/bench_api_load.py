@@ -0,0 +1,205 @@
+"""
+Offline load test of the HTTP API: p50/p99 latency and throughput of
+/users/{account_code}, /user/exists and /health under concurrency.
+
+A scratch database is seeded with synthetic 155-character account codes and
+the Discord side is replaced by a stub guild whose fetch_member sleeps for a
+configurable latency. Requests go through httpx's ASGI transport, so no
+sockets, Discord connection or real API key are involved. Codes are derived
+from --seed, so runs with the same arguments query the same data.
+
+Usage: python benchmarks/bench_api_load.py [--users 10000] [--requests 2000]
+       [--concurrency 50] [--fetch-latency-ms 50] [--cache-ratio 0.9]
+       [--unknown-ratio 0.1] [--mode combined|api] [--seed 1]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+scratch = tempfile.mkdtemp(prefix='bench_api_load_')
+os.environ['DATABASE_PATH'] = os.path.join(scratch, 'user_registry.db')
+os.environ['RATE_LIMIT_DB_PATH'] = os.path.join(scratch, 'rate_limits.db')
+os.environ['API_KEY'] = 'bench-key'
+os.environ['GUILD_ID'] = '1'
+if '--mode' in sys.argv and sys.argv[sys.argv.index('--mode') + 1] == 'api':
+    os.environ['RUN_MODE'] = 'api'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+import httpx  # noqa: E402
+
+import bot  # noqa: E402
+
+ROLES = [SimpleNamespace(id=100 + i, name=name) for i, name in enumerate(
+    ["@everyone", "Member", "Trader", "OG", "Whale", "Moderator"]
+)]
+SEED_BATCH = 50000
+
+def account_code(seed: int, index: int):
+    """Deterministic synthetic 155-character account code"""
+    digest = hashlib.shake_256(f"{seed}:{index}".encode()).digest(117)
+    return base64.urlsafe_b64encode(digest).decode()[:155]
+
+def discord_id(index: int):
+    return 10**17 + index
+
+def member_roles(index: int):
+    """Every member has @everyone and Member, plus a spread of the rest"""
+    return [ROLES[0], ROLES[1]] + [role for bit, role in enumerate(ROLES[2:]) if index >> bit & 1]
+
+class StubGuild:
+    """Stands in for the registration guild, with a simulated REST round trip"""
+    def __init__(self, fetch_latency: float, users: int):
+        self.id = 1
+        self.fetch_latency = fetch_latency
+        self.users = users
+        self.fetches = 0
+        self._roles = {role.id: role for role in ROLES}
+
+    def get_role(self, role_id):
+        return self._roles.get(role_id)
+
+    def get_member(self, member_id):
+        return None
+
+    async def fetch_member(self, member_id):
+        self.fetches += 1
+        await asyncio.sleep(self.fetch_latency)
+        index = member_id - 10**17
+        if not 0 <= index < self.users:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return SimpleNamespace(id=member_id, roles=member_roles(index))
+
+def seed_database(users: int, seed: int, cache_ratio: float):
+    """Insert the synthetic registrations, their role snapshots and warm the member cache"""
+    bot.setup_database()
+    rng = random.Random(seed)
+    with bot.get_db() as conn:
+        for start in range(0, users, SEED_BATCH):
+            indexes = range(start, min(start + SEED_BATCH, users))
+            rows = []
+            snapshots = []
+            for index in indexes:
+                code = account_code(seed, index)
+                rows.append((str(discord_id(index)), bot.account_digest(code), code))
+                names = [role.name for role in member_roles(index)[1:]]
+                snapshots.append((str(discord_id(index)), json.dumps(names), index))
+            conn.executemany(bot.SQL_INSERT_USER, rows)
+            conn.executemany(bot.SQL_UPSERT_SNAPSHOT, snapshots)
+        conn.commit()
+    bot.account_index.load()
+
+    for index in range(users):
+        if rng.random() < cache_ratio:
+            bot.member_role_cache.update(SimpleNamespace(id=discord_id(index), roles=member_roles(index)))
+
+def request_paths(args):
+    """The same request mix for every run with the same arguments"""
+    rng = random.Random(args.seed + 1)
+    codes = []
+    for _ in range(args.requests):
+        if rng.random() < args.unknown_ratio:
+            codes.append(account_code(-args.seed, rng.randrange(args.users)))
+        else:
+            codes.append(account_code(args.seed, rng.randrange(args.users)))
+    return {
+        "/users/{account_code}": [f"/users/{code}" for code in codes],
+        "/user/exists": [f"/user/exists?account_code={code}" for code in codes],
+        "/health": ["/health"] * args.requests
+    }
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+async def run_endpoint(client, paths, concurrency):
+    latencies = []
+    statuses = {}
+    pending = iter(paths)
+
+    async def worker():
+        for path in pending:
+            start = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2)
+    }
+
+async def run_benchmark(args, paths):
+    transport = httpx.ASGITransport(app=bot.app)
+    async with httpx.AsyncClient(
+        transport=transport,
+        base_url="http://bench",
+        headers={"X-API-Key": os.environ['API_KEY']}
+    ) as client:
+        # Warm up imports, statement caches and the limiter store
+        await client.get("/health")
+        return {endpoint: await run_endpoint(client, endpoint_paths, args.concurrency)
+                for endpoint, endpoint_paths in paths.items()}
+
+class UnthrottledLimiter(bot.TokenBucketLimiter):
+    """Keeps the limiter's SQLite round trip in the measurement, without ever throttling"""
+    def hit(self, key, capacity, refill_per_second):
+        return super().hit(key, 1e12, 1e12)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=2000, help="requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--fetch-latency-ms', type=float, default=50)
+    parser.add_argument('--cache-ratio', type=float, default=0.9,
+                        help="share of members in the member role cache, the rest need a REST fetch")
+    parser.add_argument('--unknown-ratio', type=float, default=0.1, help="share of unregistered codes queried")
+    parser.add_argument('--mode', choices=['combined', 'api'], default='combined')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    seed_database(args.users, args.seed, args.cache_ratio)
+    seed_seconds = time.perf_counter() - start
+
+    guild = StubGuild(args.fetch_latency_ms / 1000, args.users)
+    bot.bot.get_guild = lambda guild_id: guild
+    bot.rate_limiter = UnthrottledLimiter(os.environ['RATE_LIMIT_DB_PATH'])
+    bot.audit_log_writer.start()
+    try:
+        results = asyncio.run(run_benchmark(args, request_paths(args)))
+    finally:
+        bot.audit_log_writer.stop()
+
+    print(json.dumps({
+        "mode": args.mode,
+        "users": args.users,
+        "requests_per_endpoint": args.requests,
+        "concurrency": args.concurrency,
+        "fetch_latency_ms": args.fetch_latency_ms,
+        "cache_ratio": args.cache_ratio,
+        "unknown_ratio": args.unknown_ratio,
+        "seed": args.seed,
+        "seed_seconds": round(seed_seconds, 2),
+        "rest_fetches": guild.fetches,
+        "endpoints": results
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Shows that role lookups which miss the member cache run concurrently.
+
+Every lookup needs a Discord REST fetch, simulated by a stub guild that sleeps
+for --fetch-latency-ms. With the bot and the API on one event loop the API
+awaits the fetch, so N parallel lookups finish in about the time of one.
+N parallel lookups of one member that is not cached share a single fetch.
+The REST scheduler's concurrency cap is raised to N so it does not queue them.
+
+Usage: python benchmarks/bench_concurrent_lookups.py [--parallel 50] [--fetch-latency-ms 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+scratch = tempfile.mkdtemp(prefix='bench_concurrent_')
+os.environ['DATABASE_PATH'] = os.path.join(scratch, 'user_registry.db')
+os.environ['RATE_LIMIT_DB_PATH'] = os.path.join(scratch, 'rate_limits.db')
+os.environ['API_KEY'] = 'bench-key'
+os.environ['GUILD_ID'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import bot  # noqa: E402
+
+MEMBER_ROLE = SimpleNamespace(id=2, name="Member")
+
+class StubGuild:
+    def __init__(self, fetch_latency: float):
+        self.id = 1
+        self.fetch_latency = fetch_latency
+        self.fetches = 0
+
+    def get_role(self, role_id):
+        return MEMBER_ROLE if role_id == MEMBER_ROLE.id else None
+
+    async def fetch_member(self, member_id):
+        self.fetches += 1
+        await asyncio.sleep(self.fetch_latency)
+        return SimpleNamespace(id=member_id, roles=[MEMBER_ROLE])
+
+def account_code(index: int):
+    return f"{index:0155d}"
+
+async def timed_lookups(client, indexes):
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(f"/users/{account_code(index)}") for index in indexes))
+    elapsed = time.perf_counter() - start
+    assert all(response.status_code == 200 for response in responses), [r.status_code for r in responses]
+    return elapsed
+
+async def run(args):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=bot.app),
+        base_url="http://bench",
+        headers={"X-API-Key": os.environ['API_KEY']}
+    ) as client:
+        await client.get("/health")
+        # Distinct members each time, so every lookup misses the member cache
+        single = await timed_lookups(client, [0])
+        parallel = await timed_lookups(client, range(1, args.parallel + 1))
+        fetches = bot.bot.get_guild(1).fetches
+        identical = await timed_lookups(client, [args.parallel + 1] * args.parallel)
+        identical_fetches = bot.bot.get_guild(1).fetches - fetches
+    return single, parallel, identical, identical_fetches
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--parallel', type=int, default=50)
+    parser.add_argument('--fetch-latency-ms', type=float, default=200)
+    args = parser.parse_args()
+
+    bot.setup_database()
+    for index in range(args.parallel + 2):
+        bot.register_account(str(10**17 + index), account_code(index))
+    bot.account_index.load()
+
+    guild = StubGuild(args.fetch_latency_ms / 1000)
+    bot.bot.get_guild = lambda guild_id: guild
+    bot.rate_limiter.hit = lambda key, capacity, refill_per_second: (True, 0.0)
+    bot.rest_scheduler.max_concurrency = args.parallel
+
+    single, parallel, identical, identical_fetches = asyncio.run(run(args))
+    print(json.dumps({
+        "parallel": args.parallel,
+        "fetch_latency_ms": args.fetch_latency_ms,
+        "single_lookup_ms": round(single * 1000, 1),
+        "parallel_lookups_ms": round(parallel * 1000, 1),
+        "slowdown_vs_single": round(parallel / single, 2),
+        "identical_lookups_ms": round(identical * 1000, 1),
+        "identical_lookup_fetches": identical_fetches
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
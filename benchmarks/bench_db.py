@@ -0,0 +1,75 @@
+"""
+Micro-benchmark: per-call sqlite3.connect() vs the pooled WAL connection layer.
+
+Usage: python benchmarks/bench_db.py [--users 10000] [--lookups 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Point the bot at a scratch database before it is imported
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_db_'), 'user_registry.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+def random_code():
+    return ''.join(random.choices(string.ascii_letters + string.digits, k=155))
+
+@contextmanager
+def get_db_per_call():
+    """The previous behaviour: a fresh connection for every handler call"""
+    conn = sqlite3.connect(bot.DATABASE_PATH)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def seed(users):
+    codes = [random_code() for _ in range(users)]
+    with bot.get_db() as conn:
+        conn.executemany(
+            bot.SQL_INSERT_USER,
+            [(str(10**17 + i), bot.account_digest(code), code) for i, code in enumerate(codes)]
+        )
+        conn.commit()
+    return codes
+
+def run(label, get_db, codes, lookups):
+    sample = random.choices(codes, k=lookups)
+    start = time.perf_counter()
+    for code in sample:
+        with get_db() as conn:
+            conn.execute(bot.SQL_DISCORD_ID_BY_ACCOUNT, (bot.account_digest(code),)).fetchone()
+    elapsed = time.perf_counter() - start
+    return {
+        "label": label,
+        "lookups": lookups,
+        "total_s": round(elapsed, 4),
+        "per_lookup_us": round(elapsed / lookups * 1e6, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    bot.setup_database()
+    codes = seed(args.users)
+
+    results = [
+        run("open_per_call", get_db_per_call, codes, args.lookups),
+        run("pooled_wal", bot.get_db, codes, args.lookups),
+    ]
+    print(json.dumps({"users": args.users, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Shows that a slow query no longer stalls unrelated work on the event loop.
+
+A simulated slow profile lookup runs alongside a stream of fast lookups.
+When the slow query runs inline on the loop (the old behaviour) every fast
+lookup waits for it; through run_db() the fast lookups are unaffected.
+Exits with an assertion error if the run_db lookups are held up by more than
+a fifth of the slow query, or if the inline run fails to show the stall.
+
+Usage: python benchmarks/bench_event_loop.py [--slow-ms 500] [--fast 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_loop_'), 'user_registry.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+def slow_lookup_profile(discord_id, delay):
+    time.sleep(delay)  # simulated disk stall or lock wait
+    return bot.lookup_profile(discord_id)
+
+async def fast_lookups(count):
+    """Unrelated interactions: quick lookups spaced 10ms apart"""
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        await bot.run_db(bot.lookup_profile, str(i))
+        latencies.append(time.perf_counter() - start - 0.01)
+    return latencies
+
+async def scenario(inline, delay, fast):
+    async def slow():
+        await asyncio.sleep(0.005)
+        if inline:
+            slow_lookup_profile('0', delay)
+        else:
+            await bot.run_db(slow_lookup_profile, '0', delay)
+
+    _, latencies = await asyncio.gather(slow(), fast_lookups(fast))
+    return {
+        "mode": "inline" if inline else "run_db",
+        "fast_lookups": fast,
+        "max_fast_latency_ms": round(max(latencies) * 1000, 2),
+        "avg_fast_latency_ms": round(sum(latencies) / len(latencies) * 1000, 2)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--slow-ms', type=int, default=500)
+    parser.add_argument('--fast', type=int, default=20)
+    args = parser.parse_args()
+
+    bot.setup_database()
+    delay = args.slow_ms / 1000
+    results = [
+        await scenario(True, delay, args.fast),
+        await scenario(False, delay, args.fast),
+    ]
+    print(json.dumps({"slow_query_ms": args.slow_ms, "results": results}, indent=2))
+
+    inline, offloaded = results
+    assert inline["max_fast_latency_ms"] >= args.slow_ms / 2, "inline slow query did not stall the loop"
+    assert offloaded["max_fast_latency_ms"] < args.slow_ms / 5, "slow query delayed unrelated lookups"
+
+if __name__ == "__main__":
+    asyncio.run(main())
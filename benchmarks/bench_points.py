@@ -0,0 +1,58 @@
+"""
+Times the daily points job for a large guild: grouping the member role cache
+by role set, weighing each set and writing the daily_points rows.
+
+Usage: python benchmarks/bench_points.py [--members 100000] [--roles 12]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_points_'), 'user_registry.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--roles', type=int, default=12)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    roles = [SimpleNamespace(id=1000 + i, name=f"Role {i}") for i in range(args.roles)]
+    guild = SimpleNamespace(roles=roles)
+    bot.ROLE_POINT_WEIGHTS.update({role.name: rng.randint(0, 50) for role in roles})
+
+    bot.setup_database()
+    discord_ids = []
+    for index in range(args.members):
+        member_id = 10**17 + index
+        member_roles = [role for role in roles if rng.random() < 0.2]
+        bot.member_role_cache.update(SimpleNamespace(id=member_id, roles=member_roles))
+        discord_ids.append(str(member_id))
+
+    start = time.perf_counter()
+    rows = bot.compute_daily_points(guild, discord_ids)
+    computed = time.perf_counter()
+    asyncio.run(bot.run_db(bot.write_daily_points, '2024-01-01', rows))
+    written = time.perf_counter()
+
+    print(json.dumps({
+        "members": args.members,
+        "roles": args.roles,
+        "distinct_role_sets": len(bot.member_role_cache.group_by_roles(int(i) for i in discord_ids)),
+        "compute_seconds": round(computed - start, 3),
+        "write_seconds": round(written - computed, 3),
+        "total_seconds": round(written - start, 3)
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
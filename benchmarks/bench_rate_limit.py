@@ -0,0 +1,78 @@
+"""
+Measures the per-check cost of the shared SQLite token bucket limiter with
+several worker processes hitting the same store, as uvicorn workers would.
+
+Usage: python benchmarks/bench_rate_limit.py [--workers 4] [--seconds 5] [--keys 50]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+def worker(path, seconds, keys, results):
+    limiter = bot.TokenBucketLimiter(path)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        key = f"/users/{{account_code}}:key{random.randrange(keys)}"
+        start = time.perf_counter()
+        try:
+            limiter.hit(key, 1000, 1000 / 60)
+        except sqlite3.Error:
+            errors += 1  # the API fails open on these
+        latencies.append(time.perf_counter() - start)
+    results.put((latencies, errors))
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--keys', type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_rate_limit_'), 'rate_limits.db')
+    bot.TokenBucketLimiter(path)._connection()  # create the table up front
+
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=worker, args=(path, args.seconds, args.keys, results))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    latencies = []
+    errors = 0
+    for _ in processes:
+        worker_latencies, worker_errors = results.get()
+        latencies.extend(worker_latencies)
+        errors += worker_errors
+    latencies.sort()
+    for process in processes:
+        process.join()
+
+    print(json.dumps({
+        "workers": args.workers,
+        "keys": args.keys,
+        "checks": len(latencies),
+        "checks_per_second": round(len(latencies) / args.seconds),
+        "store_errors": errors,
+        "p50_us": round(percentile(latencies, 0.5) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1)
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
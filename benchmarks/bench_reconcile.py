@@ -0,0 +1,148 @@
+"""
+Runs the membership reconciler over a scratch database where a share of the
+registered members have left the guild, then compares /users/{account_code}
+for departed members before and after their rows are flagged.
+
+The pass is interrupted halfway and resumed from the saved cursor, as after a
+restart. --unchunked reconciles through simulated REST fetches instead of the
+chunked member list.
+
+Usage: python benchmarks/bench_reconcile.py [--users 20000] [--departed-ratio 0.2] [--chunk-size 500] [--unchunked]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+scratch = tempfile.mkdtemp(prefix='bench_reconcile_')
+os.environ['DATABASE_PATH'] = os.path.join(scratch, 'user_registry.db')
+os.environ['RATE_LIMIT_DB_PATH'] = os.path.join(scratch, 'rate_limits.db')
+os.environ['API_KEY'] = 'bench-key'
+os.environ['GUILD_ID'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+import httpx  # noqa: E402
+
+import bot  # noqa: E402
+
+class StubGuild:
+    def __init__(self, member_ids, chunked: bool, fetch_latency: float):
+        self.id = 1
+        self.chunked = chunked
+        self.fetch_latency = fetch_latency
+        self.fetches = 0
+        self._members = {member_id: SimpleNamespace(id=member_id, roles=[]) for member_id in member_ids}
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id):
+        return None
+
+    async def fetch_member(self, member_id):
+        self.fetches += 1
+        await asyncio.sleep(self.fetch_latency)
+        if member_id not in self._members:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return self._members[member_id]
+
+def account_code(index: int):
+    return f"{index:0155d}"
+
+async def reconcile_pass(guild, cursor=''):
+    chunks = 0
+    while True:
+        cursor = await bot.reconcile_chunk(guild, cursor)
+        chunks += 1
+        if cursor == '':
+            return chunks
+
+async def departed_lookups(client, indexes):
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(client.get(f"/users/{account_code(index)}") for index in indexes))
+    assert all(response.status_code == 404 for response in responses)
+    return (time.perf_counter() - start) / len(indexes)
+
+async def run(args, guild, departed):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=bot.app),
+        base_url="http://bench",
+        headers={"X-API-Key": os.environ['API_KEY']}
+    ) as client:
+        await client.get("/health")
+        bot.not_found_cache.ttl = 0  # measure the flagged path, not the 404 cache
+        sample = departed[:200]
+        fetches = guild.fetches
+        before = await departed_lookups(client, sample)
+        fetches_before = guild.fetches - fetches
+
+        # Stop halfway, then resume from the persisted cursor like a restarted bot
+        fetches = guild.fetches
+        start = time.perf_counter()
+        cursor = ''
+        for _ in range(args.users // args.chunk_size // 2):
+            cursor = await bot.reconcile_chunk(guild, cursor)
+        bot.account_index.load()
+        saved = await bot.run_db(bot.load_job_state, bot.RECONCILE_JOB)
+        assert saved == cursor, (saved, cursor)
+        chunks = args.users // args.chunk_size // 2 + await reconcile_pass(guild, saved)
+        elapsed = time.perf_counter() - start
+        reconcile_fetches = guild.fetches - fetches
+
+        fetches = guild.fetches
+        after = await departed_lookups(client, sample)
+        fetches_after = guild.fetches - fetches
+    return {
+        "reconcile_chunks": chunks,
+        "reconcile_seconds": round(elapsed, 2),
+        "reconcile_rest_fetches": reconcile_fetches,
+        "departed_lookup_ms_before": round(before * 1000, 2),
+        "departed_lookup_fetches_before": fetches_before,
+        "departed_lookup_ms_after": round(after * 1000, 2),
+        "departed_lookup_fetches_after": fetches_after
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--departed-ratio', type=float, default=0.2)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--fetch-latency-ms', type=float, default=20)
+    parser.add_argument('--unchunked', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    bot.setup_database()
+    with bot.get_db() as conn:
+        conn.executemany(bot.SQL_INSERT_USER, [
+            (str(10**17 + index), bot.account_digest(account_code(index)), account_code(index))
+            for index in range(args.users)
+        ])
+        conn.commit()
+    bot.account_index.load()
+    departed = [index for index in range(args.users) if rng.random() < args.departed_ratio]
+    departed_set = set(departed)
+    guild = StubGuild(
+        [10**17 + index for index in range(args.users) if index not in departed_set],
+        chunked=not args.unchunked,
+        fetch_latency=args.fetch_latency_ms / 1000
+    )
+    bot.bot.get_guild = lambda guild_id: guild
+    bot.rate_limiter.hit = lambda key, capacity, refill_per_second: (True, 0.0)
+    bot.RECONCILE_CHUNK_SIZE = args.chunk_size
+
+    result = asyncio.run(run(args, guild, departed))
+    flagged = set(bot.account_index.departed_ids())
+    assert flagged == {str(10**17 + index) for index in departed}, len(flagged)
+    result.update(users=args.users, departed=len(departed), flagged=len(flagged), chunked=not args.unchunked)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Simulates the registration burst after a /setup announcement: N modal
+submissions arriving at once, written either one transaction per submission
+(run_db(register_account), as the modal did before) or through the
+group-committing RegistrationWriter.
+
+A share of the submissions (--conflict-ratio) reuse a code already registered
+to someone else, so the conflict path is exercised as well.
+
+Usage: python benchmarks/bench_registration_burst.py [--submissions 1000] [--conflict-ratio 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench_registration_'), 'user_registry.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+def submissions(round_id: int, count: int, conflict_ratio: float):
+    rng = random.Random(round_id)
+    registrations = []
+    for index in range(count):
+        discord_id = str(10**17 + round_id * 10**6 + index)
+        if registrations and rng.random() < conflict_ratio:
+            code = rng.choice(registrations)[1]  # already claimed by another member
+        else:
+            code = f"{round_id}-{index}".rjust(155, 'x')
+        registrations.append((discord_id, code))
+    return registrations
+
+async def burst(label, submit, registrations):
+    latencies = []
+
+    async def one(discord_id, code):
+        start = time.perf_counter()
+        outcome, _ = await submit(discord_id, code)
+        latencies.append(time.perf_counter() - start)
+        return outcome
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(one(discord_id, code) for discord_id, code in registrations))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "label": label,
+        "submissions": len(registrations),
+        "outcomes": {outcome: outcomes.count(outcome) for outcome in sorted(set(outcomes))},
+        "total_ms": round(elapsed * 1000, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+async def run(args):
+    async def per_submission(discord_id, code):
+        return await bot.run_db(bot.register_account, discord_id, code)
+
+    results = [await burst("transaction_per_submission", per_submission,
+                           submissions(1, args.submissions, args.conflict_ratio))]
+
+    writer_task = asyncio.create_task(bot.registration_writer.run())
+    result = await burst("group_commit_writer", bot.registration_writer.submit,
+                         submissions(2, args.submissions, args.conflict_ratio))
+    result["commits"] = bot.registration_writer.batches
+    results.append(result)
+    writer_task.cancel()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--submissions', type=int, default=1000)
+    parser.add_argument('--conflict-ratio', type=float, default=0.05)
+    args = parser.parse_args()
+
+    bot.setup_database()
+    print(json.dumps({"results": asyncio.run(run(args))}, indent=2))
+
+if __name__ == "__main__":
+    main()
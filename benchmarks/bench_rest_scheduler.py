@@ -0,0 +1,76 @@
+"""
+Shows that API lookups keep their latency while a bulk job saturates the
+Discord REST budget.
+
+A bulk job of --bulk member fetches is queued at bulk priority, then --api
+lookups arrive at API priority while it is running. Every fetch goes to a stub
+guild that sleeps for --fetch-latency-ms, and at most --concurrency run at once.
+
+Usage: python benchmarks/bench_rest_scheduler.py [--bulk 500] [--api 20] [--concurrency 8] [--fetch-latency-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+scratch = tempfile.mkdtemp(prefix='bench_rest_scheduler_')
+os.environ['DATABASE_PATH'] = os.path.join(scratch, 'user_registry.db')
+os.environ['RATE_LIMIT_DB_PATH'] = os.path.join(scratch, 'rate_limits.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+class StubGuild:
+    def __init__(self, fetch_latency: float):
+        self.fetch_latency = fetch_latency
+
+    async def fetch_member(self, member_id):
+        await asyncio.sleep(self.fetch_latency)
+        return SimpleNamespace(id=member_id, roles=[])
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+async def timed_fetch(guild, member_id, operation, priority):
+    start = time.perf_counter()
+    await bot.fetch_member(guild, member_id, operation, priority)
+    return time.perf_counter() - start
+
+async def run(args):
+    guild = StubGuild(args.fetch_latency_ms / 1000)
+    start = time.perf_counter()
+    bulk = asyncio.gather(*(timed_fetch(guild, 10**17 + i, 'batch', bot.REST_PRIORITY_BULK)
+                            for i in range(args.bulk)))
+    await asyncio.sleep(args.fetch_latency_ms / 1000 * 2)
+    queue_depth = bot.rest_scheduler.queue_depth
+    api = sorted(await asyncio.gather(*(timed_fetch(guild, 10**18 + i, 'user_roles', bot.REST_PRIORITY_API)
+                                        for i in range(args.api))))
+    await bulk
+    return {
+        "bulk_fetches": args.bulk,
+        "bulk_seconds": round(time.perf_counter() - start, 2),
+        "queue_depth_when_api_arrived": queue_depth,
+        "api_lookups": args.api,
+        "api_p50_ms": round(percentile(api, 0.5) * 1000, 1),
+        "api_max_ms": round(api[-1] * 1000, 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bulk', type=int, default=500)
+    parser.add_argument('--api', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--fetch-latency-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    bot.rest_scheduler.max_concurrency = args.concurrency
+    result = asyncio.run(run(args))
+    result.update(concurrency=args.concurrency, fetch_latency_ms=args.fetch_latency_ms)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
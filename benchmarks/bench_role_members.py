@@ -0,0 +1,134 @@
+"""
+Times GET /roles/{role}/members for a role with tens of thousands of
+registered holders, paging through all of them, and checks the reverse index
+against a full scan after a stream of role changes.
+
+Usage: python benchmarks/bench_role_members.py [--members 100000] [--registered-ratio 0.6] [--limit 1000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+scratch = tempfile.mkdtemp(prefix='bench_role_members_')
+os.environ['DATABASE_PATH'] = os.path.join(scratch, 'user_registry.db')
+os.environ['RATE_LIMIT_DB_PATH'] = os.path.join(scratch, 'rate_limits.db')
+os.environ['API_KEY'] = 'bench-key'
+os.environ['GUILD_ID'] = '1'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import bot  # noqa: E402
+
+ROLES = [SimpleNamespace(id=100 + i, name=name) for i, name in enumerate(["Member", "Trader", "OG", "Whale"])]
+ROLE_SHARE = {100: 0.9, 101: 0.5, 102: 0.2, 103: 0.02}
+
+class StubGuild:
+    def __init__(self, members):
+        self.id = 1
+        self.members = members
+        self.roles = ROLES
+        self.chunked = True
+
+    def get_role(self, role_id):
+        return next((role for role in ROLES if role.id == role_id), None)
+
+def random_member(rng, member_id):
+    return SimpleNamespace(id=member_id, roles=[role for role in ROLES if rng.random() < ROLE_SHARE[role.id]])
+
+def seed(args, rng):
+    bot.setup_database()
+    members = [random_member(rng, 10**17 + index) for index in range(args.members)]
+    registered = [member for member in members if rng.random() < args.registered_ratio]
+    with bot.get_db() as conn:
+        conn.executemany(bot.SQL_INSERT_USER, [
+            (str(member.id), bot.account_digest(f"{member.id:0155d}"), f"{member.id:0155d}") for member in registered
+        ])
+        conn.commit()
+    bot.account_index.load()
+    guild = StubGuild(members)
+    start = time.perf_counter()
+    bot.member_role_cache.load_guild(guild)
+    return guild, time.perf_counter() - start
+
+def churn(guild, rng, changes):
+    """Random role changes and departures, through the member cache like the gateway events"""
+    start = time.perf_counter()
+    for _ in range(changes):
+        member = rng.choice(guild.members)
+        if rng.random() < 0.1:
+            bot.member_role_cache.remove(member.id)
+        else:
+            bot.member_role_cache.update(random_member(rng, member.id))
+    return (time.perf_counter() - start) / changes
+
+def expected_holders(role_id):
+    return sorted(
+        member_id for member_id in map(int, bot.account_index.discord_ids())
+        if role_id in (bot.member_role_cache.role_ids(member_id) or ())
+    )
+
+async def page_through(client, role, limit):
+    latencies = []
+    members = []
+    after = '0'
+    while True:
+        start = time.perf_counter()
+        response = await client.get(f"/roles/{role}/members", params={"after": after, "limit": limit})
+        latencies.append(time.perf_counter() - start)
+        body = response.json()
+        members.extend(int(member["discord_id"]) for member in body["members"])
+        after = body["next_cursor"]
+        if not body["has_more"]:
+            return body["total"], members, sorted(latencies)
+
+async def run(args):
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=bot.app),
+        base_url="http://bench",
+        headers={"X-API-Key": os.environ['API_KEY']}
+    ) as client:
+        await client.get("/health")
+        results = {}
+        for role in ROLES:
+            total, members, latencies = await page_through(client, role.name, args.limit)
+            assert members == expected_holders(role.id), role.name
+            results[role.name] = {
+                "holders": total,
+                "pages": len(latencies),
+                "page_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+                "page_max_ms": round(latencies[-1] * 1000, 2)
+            }
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=100000)
+    parser.add_argument('--registered-ratio', type=float, default=0.6)
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--changes', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    guild, build_seconds = seed(args, rng)
+    change_seconds = churn(guild, rng, args.changes)
+    bot.bot.get_guild = lambda guild_id: guild
+    bot.rate_limiter.hit = lambda key, capacity, refill_per_second: (True, 0.0)
+
+    print(json.dumps({
+        "members": args.members,
+        "registered": len(bot.account_index),
+        "index_build_seconds": round(build_seconds, 3),
+        "role_change_us": round(change_seconds * 1e6, 1),
+        "roles": asyncio.run(run(args))
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
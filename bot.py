@@ -4,21 +4,159 @@ from discord import app_commands, ui, ButtonStyle
 import sqlite3
 import os
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.security import APIKeyHeader
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import uvicorn
 import asyncio
-import nest_asyncio
-from typing import Optional
+from typing import Optional, List
+from pydantic import BaseModel
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+import atexit
+import copy
 import json
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+import gzip
+import bisect
+import heapq
+import functools
+import hashlib
+import math
+import itertools
+import queue
+import signal
+import threading
+import time
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Prometheus metrics, kept in process and rendered in the text exposition format
+METRIC_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+metrics_registry = []
+
+def format_metric_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(labelnames, values)
+    )
+    return f'{{{pairs}}}'
+
+class Counter:
+    """Monotonic counter, one series per label tuple"""
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = list(self._values.items())
+        for labels, value in series:
+            lines.append(f'{self.name}{format_metric_labels(self.labelnames, labels)} {value}')
+        return lines
+
+class Histogram:
+    """Fixed-bucket histogram; each series holds per-bucket counts followed by the sum"""
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=METRIC_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(labels, list(series)) for labels, series in self._series.items()]
+        bucket_labels = self.labelnames + ('le',)
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{self.name}_bucket{format_metric_labels(bucket_labels, labels + (le,))} {cumulative}')
+            suffix = format_metric_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{suffix} {series[-1]}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+class Gauge:
+    """Current value, read from a callback at scrape time"""
+    def __init__(self, name: str, documentation: str, callback):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        metrics_registry.append(self)
+
+    def render(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge', f'{self.name} {self.callback()}']
+
+def render_metrics():
+    lines = []
+    for metric in metrics_registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+api_request_seconds = Histogram(
+    'api_request_duration_seconds', 'API request latency by route template', ('method', 'route', 'status')
+)
+db_query_seconds = Histogram(
+    'db_query_duration_seconds', 'Time spent in SQLite per data access call site', ('call_site',)
+)
+discord_rest_requests = Counter(
+    'discord_rest_requests_total', 'Discord REST member fetches by operation and outcome', ('operation', 'outcome')
+)
+discord_rest_seconds = Histogram(
+    'discord_rest_duration_seconds', 'Discord REST member fetch latency', ('operation',)
+)
+interaction_seconds = Histogram(
+    'discord_interaction_duration_seconds', 'Discord interaction handler duration', ('handler',)
+)
+rate_limit_rejections = Counter(
+    'api_rate_limit_rejections_total', 'Requests rejected by the rate limiter', ('route',)
+)
+
+def timed_interaction(handler: str):
+    """Record an interaction handler's duration under the given name"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with interaction_seconds.time(handler):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
 
 class RegistrationModal(ui.Modal, title='Register Your Vibe Account'):
     account_code = ui.TextInput(
@@ -27,6 +165,7 @@ class RegistrationModal(ui.Modal, title='Register Your Vibe Account'):
         required=True
     )
     
+    @timed_interaction('registration_modal')
     async def on_submit(self, interaction: discord.Interaction):
         try:
             account_code = str(self.account_code)
@@ -41,76 +180,55 @@ class RegistrationModal(ui.Modal, title='Register Your Vibe Account'):
                 await interaction.response.send_message(embed=embed, ephemeral=True)
                 return
             
-            with get_db() as conn:
-                c = conn.cursor()
-                
-                # Check if this Vibe Account Code is already registered to another user
-                existing_user_check = c.execute(
-                    'SELECT discord_id FROM users WHERE account_id = ?', 
-                    (account_code,)
-                ).fetchone()
-                
-                if existing_user_check and str(existing_user_check[0]) != str(interaction.user.id):
-                    embed = discord.Embed(
-                        title="❌ Registration Error",
-                        description="This Account Code is already registered to another Discord account.",
-                        color=discord.Color.blue()
-                    )
-                    await interaction.response.send_message(embed=embed, ephemeral=True)
-                    return
-                
-                # Check if this user already has a registered Vibe Account Code
-                existing_user = c.execute(
-                    'SELECT account_id FROM users WHERE discord_id = ?', 
-                    (str(interaction.user.id),)
-                ).fetchone()
-                
-                if existing_user and existing_user[0] == account_code:
-                    embed = discord.Embed(
-                        title="❌ Registration Error",
-                        description="This Account Code is already registered to your Discord account.",
-                        color=discord.Color.blue()
-                    )
-                    await interaction.response.send_message(embed=embed, ephemeral=True)
-                    return
-                
-                if existing_user:
-                    old_account_code = existing_user[0]
-                    update_message = f"Your Vibe Account Code has been updated. Previous Code: {old_account_code}"
-                    
-                    c.execute(
-                        'UPDATE users SET account_id = ?, last_updated = CURRENT_TIMESTAMP WHERE discord_id = ?',
-                        (account_code, str(interaction.user.id))
-                    )
-                else:
-                    c.execute(
-                        'INSERT INTO users (discord_id, account_id) VALUES (?, ?)',
-                        (str(interaction.user.id), account_code)
-                    )
-                
-                c.execute(
-                    'INSERT INTO audit_log (action, discord_id, details) VALUES (?, ?, ?)',
-                    ('register', str(interaction.user.id), f'Updated Vibe Account Code: {account_code}')
+            outcome, old_account_code = await registration_writer.submit(
+                str(interaction.user.id),
+                account_code,
+                [role.name for role in getattr(interaction.user, 'roles', []) if role.name != "@everyone"]
+            )
+            
+            # Check if this Vibe Account Code is already registered to another user
+            if outcome == 'taken':
+                embed = discord.Embed(
+                    title="❌ Registration Error",
+                    description="This Account Code is already registered to another Discord account.",
+                    color=discord.Color.blue()
                 )
-                
-                conn.commit()
-                
-                if existing_user:
-                    embed = discord.Embed(
-                        title="🔄 Registration Updated",
-                        description=update_message,
-                        color=discord.Color.blue()
-                    )
-                else:
-                    embed = discord.Embed(
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            
+            # Check if this user already has this Vibe Account Code registered
+            if outcome == 'unchanged':
+                embed = discord.Embed(
+                    title="❌ Registration Error",
+                    description="This Account Code is already registered to your Discord account.",
+                    color=discord.Color.blue()
+                )
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            
+            account_index.add(str(interaction.user.id), account_digest(account_code))
+            not_found_cache.discard(account_digest(account_code))
+            role_ids = member_role_cache.role_ids(interaction.user.id)
+            if role_ids is not None:
+                role_member_index.update(interaction.user.id, role_ids)
+            audit_log_writer.log('register', str(interaction.user.id), f'Updated Vibe Account Code: {account_code}')
+            
+            if outcome == 'updated':
+                embed = discord.Embed(
+                    title="🔄 Registration Updated",
+                    description=f"Your Vibe Account Code has been updated. Previous Code: {old_account_code}",
+                    color=discord.Color.blue()
+                )
+            else:
+                embed = discord.Embed(
                     title="✅ Registration Successful",
                     description=f"You have successfully linked your Vibe Account to this Discord account!",
                     color=discord.Color.blue()
                 )
-                
-                # embed.add_field(name="Registered Vibe Account Code", value=account_code, inline=False)
-                
-                await interaction.response.send_message(embed=embed, ephemeral=True)
+            
+            # embed.add_field(name="Registered Vibe Account Code", value=account_code, inline=False)
+            
+            await interaction.response.send_message(embed=embed, ephemeral=True)
                 
         except Exception as e:
             logger.error(f"Error in registration modal: {str(e)}", exc_info=True)
@@ -141,21 +259,124 @@ class UpdateCodeView(ui.View):
         # Open the registration modal for Code update
         await interaction.response.send_modal(RegistrationModal())
 
+# Paginated registered users list for the /users command
+USERS_PAGE_SIZE = 20
+USERS_FIRST_CURSOR = ('9999-12-31 23:59:59', '')
+
+class UserListView(ui.View):
+    def __init__(self, owner_id: int, guild: discord.Guild, total: int):
+        super().__init__(timeout=300)  # 5-minute timeout
+        self.owner_id = owner_id
+        self.guild = guild
+        self.total = total
+        # Keyset cursor (timestamp, discord_id) of every page visited so far
+        self.cursors = [USERS_FIRST_CURSOR]
+        self.rows = []
+    
+    async def load_page(self):
+        """Fetch the page at the current cursor, plus one row to detect a next page"""
+        rows = await run_db(fetch_users_page, *self.cursors[-1], USERS_PAGE_SIZE + 1)
+        self.rows = rows[:USERS_PAGE_SIZE]
+        self.previous_button.disabled = len(self.cursors) == 1
+        self.next_button.disabled = len(rows) <= USERS_PAGE_SIZE
+    
+    def render(self):
+        page = len(self.cursors)
+        pages = max((self.total + USERS_PAGE_SIZE - 1) // USERS_PAGE_SIZE, 1)
+        message = f"🔍 **Registered Users** 🔍 (page {page}/{pages}, {self.total} total)\n\n"
+        message += "```\n"
+        message += f"{'Username':<30} {'Discord ID':<20} {'Registered On (UTC)'}\n"
+        message += "-" * 80 + "\n"
+        
+        for discord_id, account_code, timestamp in self.rows:
+            member = self.guild.get_member(int(discord_id))
+            username = member.name if member else "User Left Server"
+            truncated_username = (username[:27] + '...') if len(username) > 30 else username
+            message += f"{truncated_username:<30} {discord_id:<20} {timestamp}\n"
+        
+        message += "```"
+        return message
+    
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.owner_id
+    
+    @discord.ui.button(label="◀ Previous", style=ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, button: ui.Button):
+        self.cursors.pop()
+        await self.load_page()
+        await interaction.response.edit_message(content=self.render(), view=self)
+    
+    @discord.ui.button(label="Next ▶", style=ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        discord_id, account_code, timestamp = self.rows[-1]
+        self.cursors.append((timestamp, discord_id))
+        await self.load_page()
+        await interaction.response.edit_message(content=self.render(), view=self)
+
+AUDIT_PAGE_SIZE = 10
+AUDIT_FIRST_CURSOR = ('9999-12-31 23:59:59', 0)
+
+class AuditLogView(ui.View):
+    def __init__(self, owner_id: int, user: discord.User, total: int):
+        super().__init__(timeout=300)  # 5-minute timeout
+        self.owner_id = owner_id
+        self.user = user
+        self.total = total
+        # Keyset cursor (timestamp, id) of every page visited so far
+        self.cursors = [AUDIT_FIRST_CURSOR]
+        self.rows = []
+    
+    async def load_page(self):
+        """Fetch the page at the current cursor, plus one row to detect a next page"""
+        rows = await run_db(fetch_audit_page, str(self.user.id), *self.cursors[-1], AUDIT_PAGE_SIZE + 1)
+        self.rows = rows[:AUDIT_PAGE_SIZE]
+        self.previous_button.disabled = len(self.cursors) == 1
+        self.next_button.disabled = len(rows) <= AUDIT_PAGE_SIZE
+    
+    def render(self):
+        page = len(self.cursors)
+        pages = max((self.total + AUDIT_PAGE_SIZE - 1) // AUDIT_PAGE_SIZE, 1)
+        message = f"📜 **Audit Log for {self.user.name}** 📜 (page {page}/{pages}, {self.total} total)\n\n"
+        message += "```\n"
+        message += f"{'Time (UTC)':<20} {'Action':<16} {'Details'}\n"
+        message += "-" * 80 + "\n"
+        
+        for entry_id, action, details, timestamp in self.rows:
+            details = details or ''
+            truncated_details = (details[:57] + '...') if len(details) > 60 else details
+            message += f"{timestamp:<20} {action:<16} {truncated_details}\n"
+        
+        message += "```"
+        if AUDIT_RETENTION_DAYS > 0:
+            message += f"\nEntries older than {AUDIT_RETENTION_DAYS} days are moved to the audit archive."
+        return message
+    
+    async def interaction_check(self, interaction: discord.Interaction):
+        return interaction.user.id == self.owner_id
+    
+    @discord.ui.button(label="◀ Previous", style=ButtonStyle.secondary)
+    async def previous_button(self, interaction: discord.Interaction, button: ui.Button):
+        self.cursors.pop()
+        await self.load_page()
+        await interaction.response.edit_message(content=self.render(), view=self)
+    
+    @discord.ui.button(label="Next ▶", style=ButtonStyle.secondary)
+    async def next_button(self, interaction: discord.Interaction, button: ui.Button):
+        entry_id, action, details, timestamp = self.rows[-1]
+        self.cursors.append((timestamp, entry_id))
+        await self.load_page()
+        await interaction.response.edit_message(content=self.render(), view=self)
+
 class RegistrationView(ui.View):
     def __init__(self):
         super().__init__(timeout=None)  # Persistent buttons
     
-    @discord.ui.button(label="Connect", style=ButtonStyle.primary)
+    @discord.ui.button(label="Connect", style=ButtonStyle.primary, custom_id="registration:connect")
+    @timed_interaction('register_button')
     async def register_button(self, interaction: discord.Interaction, button: ui.Button):
         try:
             # First check if user is already registered
-            with get_db() as conn:
-                c = conn.cursor()
-                
-                user_details = c.execute(
-                    'SELECT account_id, timestamp, last_updated FROM users WHERE discord_id = ?', 
-                    (str(interaction.user.id),)
-                ).fetchone()
+            user_details = await run_db(lookup_profile, str(interaction.user.id))
             
             if user_details:
                 # User is already registered, show profile with Update Code button
@@ -259,72 +480,67 @@ class RegistrationView(ui.View):
                 ephemeral=True
             )
     
-    @discord.ui.button(label="I've Already Connected", style=ButtonStyle.secondary)
+    @discord.ui.button(label="I've Already Connected", style=ButtonStyle.secondary, custom_id="registration:verify")
+    @timed_interaction('verify_button')
     async def verify_button(self, interaction: discord.Interaction, button: ui.Button):
         # Reuse check command logic
         try:
-            with get_db() as conn:
-                c = conn.cursor()
-                
-                user_details = c.execute(
-                    'SELECT account_id, timestamp, last_updated FROM users WHERE discord_id = ?', 
-                    (str(interaction.user.id),)
-                ).fetchone()
-                
-                if not user_details:
-                    embed = discord.Embed(
-                        title="Profile Not Found",
-                        description="You haven't linked your Discord and Vibe accounts yet. Click the Connect button to link your accounts now.",
-                        color=discord.Color.red()
-                    )
-                    await interaction.response.send_message(embed=embed, ephemeral=True)
-                    return
-                
-                account_code, timestamp, last_updated = user_details
-                
+            user_details = await run_db(lookup_profile, str(interaction.user.id))
+            
+            if not user_details:
                 embed = discord.Embed(
-                    title="Profile Details",
-                    description="✅ You are registered!",
-                    color=discord.Color.blue()
-                )
-                
-                embed.set_author(
-                    name=interaction.user.name,
-                    icon_url=interaction.user.avatar.url if interaction.user.avatar else None
-                )
-                
-                '''
-                embed.add_field(
-                    name="Vibe Account Code",
-                    value=account_code,
-                    inline=False
-                )
-                '''
-                
-                embed.add_field(
-                    name="Registration Date",
-                    value=timestamp if timestamp else "Unknown",
-                    inline=False
+                    title="Profile Not Found",
+                    description="You haven't linked your Discord and Vibe accounts yet. Click the Connect button to link your accounts now.",
+                    color=discord.Color.red()
                 )
-                
-                if last_updated and last_updated != timestamp:
-                    embed.add_field(
-                        name="Last Updated",
-                        value=last_updated,
-                        inline=False
-                    )
-                
-                # Get user's roles
-                roles = [role.name for role in interaction.user.roles if role.name != "@everyone"]
-                
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+            
+            account_code, timestamp, last_updated = user_details
+            
+            embed = discord.Embed(
+                title="Profile Details",
+                description="✅ You are registered!",
+                color=discord.Color.blue()
+            )
+            
+            embed.set_author(
+                name=interaction.user.name,
+                icon_url=interaction.user.avatar.url if interaction.user.avatar else None
+            )
+            
+            '''
+            embed.add_field(
+                name="Vibe Account Code",
+                value=account_code,
+                inline=False
+            )
+            '''
+            
+            embed.add_field(
+                name="Registration Date",
+                value=timestamp if timestamp else "Unknown",
+                inline=False
+            )
+            
+            if last_updated and last_updated != timestamp:
                 embed.add_field(
-                    name="📋 Discord Roles", 
-                    value="\n".join(roles) if roles else "No roles", 
+                    name="Last Updated",
+                    value=last_updated,
                     inline=False
                 )
-                
-                await interaction.response.send_message(embed=embed, ephemeral=True)
-                
+            
+            # Get user's roles
+            roles = [role.name for role in interaction.user.roles if role.name != "@everyone"]
+            
+            embed.add_field(
+                name="📋 Discord Roles", 
+                value="\n".join(roles) if roles else "No roles", 
+                inline=False
+            )
+            
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            
         except Exception as e:
             logger.error(f"Error in verify button: {str(e)}", exc_info=True)
             error_embed = discord.Embed(
@@ -334,24 +550,125 @@ class RegistrationView(ui.View):
             )
             await interaction.response.send_message(embed=error_embed, ephemeral=True)
             
-# Apply nest_asyncio to allow nested event loops
-nest_asyncio.apply()
-
 # Load environment variables
 load_dotenv()
 
-# Setup logging
-logging.basicConfig(level=logging.INFO)
+# Deployment mode: 'combined' runs the bot and API in one process, 'bot' runs
+# only the bot and publishes member role snapshots, 'api' serves lookups from
+# those snapshots without a Discord connection (started through api.py)
+RUN_MODE = os.getenv('RUN_MODE', 'combined')
+WRITE_ROLE_SNAPSHOTS = RUN_MODE == 'bot' or os.getenv('WRITE_ROLE_SNAPSHOTS') == '1'
+ROLE_SNAPSHOT_INTERVAL = float(os.getenv('ROLE_SNAPSHOT_INTERVAL', '2.0'))
+
+# Setup logging. Callers only enqueue records; formatting, console output and
+# bot.log rotation happen on a listener thread so they never stall the event loop
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_SAMPLE_BURST = int(os.getenv('LOG_SAMPLE_BURST', '10'))
+LOG_SAMPLE_WINDOW = float(os.getenv('LOG_SAMPLE_WINDOW', '60'))
+
+log_records_dropped = Counter('log_records_dropped_total', 'Log records dropped because the log queue was full')
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per line"""
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry)
+
+class CallSiteSampler(logging.Filter):
+    """
+    Lets through at most LOG_SAMPLE_BURST records per call site per window for
+    records logged with extra={'sampled': True}, noting how many were suppressed.
+    """
+    def __init__(self, burst: int, window: float):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not getattr(record, 'sampled', False):
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count, suppressed = self._sites.get(site, (now, 0, 0))
+            if now - window_start >= self.window:
+                window_start, count = now, 0
+            if count >= self.burst:
+                self._sites[site] = (window_start, count, suppressed + 1)
+                return False
+            self._sites[site] = (window_start, count + 1, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """Drops records instead of blocking the caller when the queue is full"""
+    def prepare(self, record):
+        # Resolve the message and traceback text here, leaving the layout to the listener's formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc()
+
+if LOG_FORMAT == 'json':
+    log_formatter = JsonLogFormatter()
+else:
+    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(log_formatter)
+log_handlers = [console_handler]
+# bot.log keeps receiving only this module's records, as before. RotatingFileHandler
+# is not safe across processes, so api.py's workers log to the console only.
+if RUN_MODE != 'api':
+    handler = RotatingFileHandler('bot.log', maxBytes=10000000, backupCount=5)
+    handler.setFormatter(log_formatter)
+    handler.addFilter(logging.Filter(__name__))
+    log_handlers.append(handler)
+
+log_queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+log_queue_handler.addFilter(CallSiteSampler(LOG_SAMPLE_BURST, LOG_SAMPLE_WINDOW))
+log_listener = QueueListener(log_queue_handler.queue, *log_handlers, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+logging.basicConfig(level=logging.INFO, handlers=[log_queue_handler])
 logger = logging.getLogger(__name__)
-handler = RotatingFileHandler('bot.log', maxBytes=10000000, backupCount=5)
-handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-logger.addHandler(handler)
 
-# Initialize FastAPI with rate limiting
-app = FastAPI(title="Discord Role API", version="1.0.0")
-limiter = Limiter(key_func=get_remote_address)
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+@asynccontextmanager
+async def api_lifespan(app: FastAPI):
+    # Standalone API workers have no main(), so they start their own audit writer
+    if RUN_MODE == 'api':
+        audit_log_writer.start()
+    try:
+        yield
+    finally:
+        if RUN_MODE == 'api':
+            audit_log_writer.stop()
+
+# Initialize FastAPI
+app = FastAPI(title="Discord Role API", version="1.0.0", lifespan=api_lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -362,6 +679,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class RequestMetricsMiddleware:
+    """
+    Plain ASGI middleware timing each request until its response completes.
+    Requests are labelled by route template, so account codes never become labels.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = scope.get('route')
+            api_request_seconds.observe(
+                time.perf_counter() - start,
+                scope['method'],
+                route.path if route else 'unmatched',
+                status
+            )
+
+app.add_middleware(RequestMetricsMiddleware)
+
 # API Key security
 API_KEY_NAME = "X-API-Key"
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=True)
@@ -369,44 +721,501 @@ api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=True)
 async def get_api_key(api_key_header: str = Depends(api_key_header)):
     expected_key = os.getenv('API_KEY')
     if not expected_key:
-        logger.error("API_KEY not set in environment variables")
+        logger.error("API_KEY not set in environment variables", extra={"sampled": True})
         raise HTTPException(
             status_code=500,
             detail="Server configuration error"
         )
     
     if not api_key_header or api_key_header != expected_key:
-        logger.warning(f"Invalid API key attempt: {api_key_header[:10]}...")
+        logger.warning(f"Invalid API key attempt: {api_key_header[:10]}...", extra={"sampled": True})
         raise HTTPException(
             status_code=403,
             detail="Invalid API Key"
         )
     return api_key_header
 
-# Database context manager
+# Token bucket rate limiting shared by every API worker process through a
+# small SQLite store, keyed on the API key (and optionally the client IP)
+RATE_LIMIT_DB_PATH = os.getenv('RATE_LIMIT_DB_PATH', 'rate_limits.db')
+RATE_LIMIT_KEY_MODE = os.getenv('RATE_LIMIT_KEY_MODE', 'api_key')  # 'api_key' or 'api_key+ip'
+RATE_LIMIT_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+class TokenBucketLimiter:
+    """Token buckets stored in SQLite, refilled and spent in one atomic statement"""
+    HIT_SQL = '''
+        INSERT INTO buckets (key, tokens, updated, allowed) VALUES (?1, ?2 - 1, ?3, 1)
+        ON CONFLICT(key) DO UPDATE SET
+            allowed = MIN(?2, tokens + (?3 - updated) * ?4) >= 1,
+            tokens = MIN(?2, tokens + (?3 - updated) * ?4)
+                     - (MIN(?2, tokens + (?3 - updated) * ?4) >= 1),
+            updated = ?3
+        RETURNING allowed, tokens
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit; the bucket state is disposable so it is never fsynced
+            conn = sqlite3.connect(self.path, timeout=0.25, isolation_level=None, cached_statements=16)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    allowed INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def hit(self, key: str, capacity: float, refill_per_second: float):
+        """Spend one token, returning (allowed, seconds until the next token)"""
+        allowed, tokens = self._connection().execute(
+            self.HIT_SQL, (key, capacity, time.time(), refill_per_second)
+        ).fetchone()
+        if allowed:
+            return True, 0.0
+        return False, (1 - tokens) / refill_per_second
+
+rate_limiter = TokenBucketLimiter(RATE_LIMIT_DB_PATH)
+
+def rate_limit_identity(request: Request, api_key: str):
+    """Bucket identity: a digest of the API key, plus the client IP if configured"""
+    identity = hashlib.blake2b(api_key.encode(), digest_size=8).hexdigest()
+    if RATE_LIMIT_KEY_MODE == 'api_key+ip':
+        # X-Forwarded-For is client-controlled; uvicorn only applies it from FORWARDED_ALLOW_IPS proxies
+        identity += f":{request.client.host if request.client else '-'}"
+    return identity
+
+def rate_limit(limit: str):
+    """Route dependency enforcing a limit such as '1000/minute' per caller identity"""
+    count, period = limit.split('/')
+    capacity = float(count)
+    refill_per_second = capacity / RATE_LIMIT_PERIODS[period]
+
+    async def check_rate_limit(request: Request, api_key: str = Depends(get_api_key)):
+        bucket = f"{request.scope['route'].path}:{rate_limit_identity(request, api_key)}"
+        try:
+            allowed, retry_after = await run_db(rate_limiter.hit, bucket, capacity, refill_per_second)
+        except sqlite3.Error as e:
+            # Fail open, a broken limiter store must not take the API down
+            logger.error(f"Rate limiter error: {e}", extra={"sampled": True})
+            return
+        if not allowed:
+            rate_limit_rejections.inc(request.scope['route'].path)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {limit}",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+    return check_rate_limit
+
+# Batch lookup request body
+BATCH_LOOKUP_MAX_CODES = int(os.getenv('BATCH_LOOKUP_MAX_CODES', '500'))
+
+class BatchLookupRequest(BaseModel):
+    account_codes: List[str]
+
+# Database connection layer
+DATABASE_PATH = os.getenv('DATABASE_PATH', 'user_registry.db')
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '16384'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+# Fixed queries, shared so every call site hits the per-connection statement cache
+SQL_DISCORD_ID_BY_ACCOUNT = 'SELECT discord_id FROM users WHERE account_hash = ?'
+SQL_ACCOUNT_BY_DISCORD_ID = 'SELECT account_id FROM users WHERE discord_id = ?'
+SQL_PROFILE_BY_DISCORD_ID = 'SELECT account_id, timestamp, last_updated FROM users WHERE discord_id = ?'
+SQL_ALL_ACCOUNTS = 'SELECT account_hash, discord_id FROM users'
+SQL_DEPARTED_USERS = 'SELECT discord_id FROM users WHERE left_guild_at IS NOT NULL'
+SQL_RECONCILE_PAGE = '''
+    SELECT discord_id, left_guild_at IS NOT NULL FROM users
+    WHERE discord_id > ? ORDER BY discord_id LIMIT ?
+'''
+SQL_MARK_LEFT = 'UPDATE users SET left_guild_at = CURRENT_TIMESTAMP WHERE discord_id = ? AND left_guild_at IS NULL'
+SQL_MARK_RETURNED = 'UPDATE users SET left_guild_at = NULL WHERE discord_id = ?'
+SQL_JOB_STATE = 'SELECT value FROM job_state WHERE name = ?'
+SQL_SAVE_JOB_STATE = 'INSERT INTO job_state (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = excluded.value'
+SQL_COUNT_USERS = 'SELECT COUNT(*) FROM users'
+SQL_USERS_PAGE = '''
+    SELECT discord_id, account_id, timestamp FROM users
+    WHERE (timestamp, discord_id) < (?, ?)
+    ORDER BY timestamp DESC, discord_id DESC LIMIT ?
+'''
+SQL_INSERT_USER = 'INSERT INTO users (discord_id, account_hash, account_id) VALUES (?, ?, ?)'
+# Registration in one statement: a code owned by someone else violates the
+# account_hash UNIQUE constraint, resubmitting the current code updates nothing
+# and returns no row, and an update returns the code it replaced
+SQL_UPSERT_REGISTRATION = '''
+    INSERT INTO users (discord_id, account_hash, account_id) VALUES (?, ?, ?)
+    ON CONFLICT(discord_id) DO UPDATE SET
+        previous_account_id = account_id,
+        account_hash = excluded.account_hash,
+        account_id = excluded.account_id,
+        last_updated = CURRENT_TIMESTAMP
+    WHERE account_hash != excluded.account_hash
+    RETURNING previous_account_id
+'''
+SQL_DELETE_USER = 'DELETE FROM users WHERE discord_id = ?'
+SQL_INSERT_AUDIT_LOG = 'INSERT INTO audit_log (action, discord_id, details, timestamp) VALUES (?, ?, ?, ?)'
+SQL_INSERT_ROLE_CHANGE = '''
+    INSERT INTO role_changes (event, discord_id, account_id, roles, created_at) VALUES (?, ?, ?, ?, ?)
+'''
+SQL_CHANGES_PAGE = '''
+    SELECT id, event, discord_id, account_id, roles, created_at FROM role_changes
+    WHERE id > ? ORDER BY id LIMIT ?
+'''
+SQL_SNAPSHOT_ROLES = 'SELECT roles, version FROM member_roles WHERE discord_id = ?'
+SQL_UPSERT_SNAPSHOT = '''
+    INSERT INTO member_roles (discord_id, roles, version, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(discord_id) DO UPDATE SET
+        roles = excluded.roles, version = excluded.version, updated_at = excluded.updated_at
+'''
+SQL_DELETE_SNAPSHOT = 'DELETE FROM member_roles WHERE discord_id = ?'
+SQL_ALL_SNAPSHOTS = 'SELECT discord_id, roles FROM member_roles'
+SQL_AUDIT_PAGE = '''
+    SELECT id, action, details, timestamp FROM audit_log
+    WHERE discord_id = ? AND (timestamp, id) < (?, ?)
+    ORDER BY timestamp DESC, id DESC LIMIT ?
+'''
+SQL_COUNT_AUDIT_FOR_USER = 'SELECT COUNT(*) FROM audit_log WHERE discord_id = ?'
+SQL_OLDEST_AUDIT_ROWS = 'SELECT id, action, discord_id, details, timestamp FROM audit_log ORDER BY id LIMIT ?'
+SQL_DELETE_AUDIT_RANGE = 'DELETE FROM audit_log WHERE id BETWEEN ? AND ?'
+SQL_DELETE_POINTS_DAY = 'DELETE FROM daily_points WHERE day = ?'
+SQL_INSERT_POINTS = 'INSERT INTO daily_points (day, discord_id, points) VALUES (?, ?, ?)'
+SQL_POINTS_DAY_EXISTS = 'SELECT 1 FROM daily_points WHERE day = ? LIMIT 1'
+SQL_POINTS_PAGE = '''
+    SELECT p.discord_id, u.account_id, p.points
+    FROM daily_points p LEFT JOIN users u ON u.discord_id = p.discord_id
+    WHERE p.day = ? AND p.discord_id > ? ORDER BY p.discord_id LIMIT ?
+'''
+SQL_EXPORT_PAGE = '''
+    SELECT u.discord_id, u.account_id, m.roles
+    FROM users u LEFT JOIN member_roles m ON m.discord_id = u.discord_id
+    WHERE u.discord_id > ? ORDER BY u.discord_id LIMIT ?
+'''
+
+_db_local = threading.local()
+
+def account_digest(account_code: str) -> bytes:
+    """Fixed-width 16-byte lookup key for a 155-character account code"""
+    return hashlib.blake2b(account_code.encode(), digest_size=16).digest()
+
+def connect_db():
+    """Open a connection in WAL mode with the tuned pragmas"""
+    conn = sqlite3.connect(DATABASE_PATH, timeout=5.0, cached_statements=256)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size={DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+# Database context manager, reusing one long-lived connection per thread
 @contextmanager
-def get_db():
-    conn = sqlite3.connect('user_registry.db')
+def get_db(call_site: str = 'other'):
+    conn = getattr(_db_local, 'conn', None)
+    if conn is None:
+        conn = _db_local.conn = connect_db()
+    start = time.perf_counter()
     try:
         yield conn
     finally:
-        conn.close()
+        # Discard uncommitted work, as closing the connection used to
+        if conn.in_transaction:
+            conn.rollback()
+        db_query_seconds.observe(time.perf_counter() - start, call_site)
 
-# Enhanced database setup
-def setup_database():
-    with get_db() as conn:
+# Async data access: blocking queries run on a dedicated executor so
+# Discord interaction handlers never block the event loop
+db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('DB_WORKERS', '4')),
+    thread_name_prefix="db"
+)
+
+async def run_db(fn, *args):
+    """Run a blocking data access function on the database executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, fn, *args)
+
+def lookup_profile(discord_id: str):
+    """Return (account_id, timestamp, last_updated) for a user, or None"""
+    with get_db('lookup_profile') as conn:
+        return conn.execute(SQL_PROFILE_BY_DISCORD_ID, (discord_id,)).fetchone()
+
+def count_registered_users():
+    with get_db('count_registered_users') as conn:
+        return conn.execute(SQL_COUNT_USERS).fetchone()[0]
+
+def fetch_users_page(before_timestamp: str, before_discord_id: str, limit: int):
+    """Keyset page of (discord_id, account_id, timestamp), newest registrations first"""
+    with get_db('fetch_users_page') as conn:
+        return conn.execute(SQL_USERS_PAGE, (before_timestamp, before_discord_id, limit)).fetchall()
+
+def change_row(event: str, discord_id: str, account_code: Optional[str] = None, roles=None):
+    """Build a role_changes row for SQL_INSERT_ROLE_CHANGE"""
+    return (
+        event,
+        discord_id,
+        account_code,
+        json.dumps(roles) if roles is not None else None,
+        datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    )
+
+def upsert_registration(conn: sqlite3.Connection, discord_id: str, account_code: str):
+    """
+    Link an account code to a user with a single statement.
+    Returns (outcome, previous code) where outcome is one of
+    'taken', 'unchanged', 'updated' or 'registered'.
+    """
+    try:
+        row = conn.execute(
+            SQL_UPSERT_REGISTRATION, (discord_id, account_digest(account_code), account_code)
+        ).fetchone()
+    except sqlite3.IntegrityError:
+        # Only the failed statement is rolled back, the rest of the batch stands
+        return 'taken', None
+    if row is None:
+        return 'unchanged', account_code
+    if row[0] is None:
+        return 'registered', None
+    return 'updated', row[0]
+
+def register_accounts(registrations):
+    """
+    Apply (discord_id, account_code, roles) registrations in order, committing
+    them together with their change feed rows
+    """
+    with get_db('register_accounts') as conn:
+        results = []
+        for discord_id, account_code, roles in registrations:
+            outcome, previous_code = upsert_registration(conn, discord_id, account_code)
+            if outcome in ('registered', 'updated'):
+                event = 'code_updated' if outcome == 'updated' else 'registered'
+                conn.execute(SQL_INSERT_ROLE_CHANGE, change_row(event, discord_id, account_code, roles))
+            results.append((outcome, previous_code))
+        conn.commit()
+    return results
+
+def register_account(discord_id: str, account_code: str, roles=None):
+    return register_accounts([(discord_id, account_code, roles)])[0]
+
+def lookup_snapshot_roles(discord_id: str):
+    """Return (role names, role version) from the member_roles snapshot, or None"""
+    with get_db('lookup_snapshot_roles') as conn:
+        result = conn.execute(SQL_SNAPSHOT_ROLES, (discord_id,)).fetchone()
+    return (json.loads(result[0]), result[1]) if result else None
+
+def load_snapshot_roles():
+    """Map every snapshotted discord id to its role names"""
+    with get_db('load_snapshot_roles') as conn:
+        return {discord_id: json.loads(roles) for discord_id, roles in conn.execute(SQL_ALL_SNAPSHOTS)}
+
+def lookup_snapshot_roles_many(discord_ids):
+    """Map discord ids to snapshot role names, skipping members without a snapshot"""
+    if not discord_ids:
+        return {}
+    placeholders = ','.join('?' * len(discord_ids))
+    with get_db('lookup_snapshot_roles_many') as conn:
+        rows = conn.execute(
+            f'SELECT discord_id, roles FROM member_roles WHERE discord_id IN ({placeholders})',
+            list(discord_ids)
+        ).fetchall()
+    return {discord_id: json.loads(roles) for discord_id, roles in rows}
+
+def lookup_account_codes(discord_ids):
+    """Map discord ids to their registered account codes"""
+    if not discord_ids:
+        return {}
+    placeholders = ','.join('?' * len(discord_ids))
+    with get_db('lookup_account_codes') as conn:
+        return dict(conn.execute(
+            f'SELECT discord_id, account_id FROM users WHERE discord_id IN ({placeholders})',
+            list(discord_ids)
+        ).fetchall())
+
+def fetch_export_page(after_discord_id: str, limit: int):
+    """Keyset page of (discord_id, account_id, snapshot roles json) ordered by discord_id"""
+    with get_db('fetch_export_page') as conn:
+        return conn.execute(SQL_EXPORT_PAGE, (after_discord_id, limit)).fetchall()
+
+def write_daily_points(day: str, rows):
+    """Replace the stored points of a day with (discord_id, points) rows in one transaction"""
+    with get_db('write_daily_points') as conn:
+        conn.execute(SQL_DELETE_POINTS_DAY, (day,))
+        conn.executemany(SQL_INSERT_POINTS, [(day, discord_id, points) for discord_id, points in rows])
+        conn.commit()
+
+def daily_points_exist(day: str):
+    with get_db('daily_points_exist') as conn:
+        return conn.execute(SQL_POINTS_DAY_EXISTS, (day,)).fetchone() is not None
+
+def fetch_points_page(day: str, after_discord_id: str, limit: int):
+    """Keyset page of (discord_id, account_id, points) for a day, ordered by discord_id"""
+    with get_db('fetch_points_page') as conn:
+        return conn.execute(SQL_POINTS_PAGE, (day, after_discord_id, limit)).fetchall()
+
+def fetch_changes_page(since: int, limit: int):
+    with get_db('fetch_changes_page') as conn:
+        return conn.execute(SQL_CHANGES_PAGE, (since, limit)).fetchall()
+
+def write_role_snapshots(rows, removed_ids, keep_ids=None):
+    """
+    Upsert (discord_id, roles json, version) snapshots and drop departed members
+    in one transaction. If keep_ids is given, every snapshot not in it is dropped too.
+    """
+    with get_db('write_role_snapshots') as conn:
+        conn.executemany(SQL_UPSERT_SNAPSHOT, rows)
+        conn.executemany(SQL_DELETE_SNAPSHOT, [(discord_id,) for discord_id in removed_ids])
+        if keep_ids is not None:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS snapshot_keep (discord_id TEXT PRIMARY KEY)')
+            conn.execute('DELETE FROM snapshot_keep')
+            conn.executemany('INSERT INTO snapshot_keep (discord_id) VALUES (?)', [(discord_id,) for discord_id in keep_ids])
+            conn.execute('DELETE FROM member_roles WHERE discord_id NOT IN (SELECT discord_id FROM snapshot_keep)')
+            conn.execute('DELETE FROM snapshot_keep')
+        conn.commit()
+
+def fetch_reconcile_page(after_discord_id: str, limit: int):
+    """Keyset page of (discord_id, has left) ordered by discord_id"""
+    with get_db('fetch_reconcile_page') as conn:
+        return conn.execute(SQL_RECONCILE_PAGE, (after_discord_id, limit)).fetchall()
+
+def mark_membership(left_ids, returned_ids, job: Optional[str] = None, cursor: Optional[str] = None,
+                    changes=(), record_left: bool = True):
+    """
+    Flag members who left the guild and clear returning ones, saving the job
+    cursor and any change feed rows in the same transaction. Newly flagged
+    members get a member_left change unless record_left is off, and their
+    snapshots are deleted so standalone API workers stop serving their roles.
+    """
+    with get_db('mark_membership') as conn:
+        conn.executemany(SQL_INSERT_ROLE_CHANGE, changes)
+        for discord_id in left_ids:
+            if conn.execute(SQL_MARK_LEFT, (discord_id,)).rowcount and record_left:
+                conn.execute(SQL_INSERT_ROLE_CHANGE, change_row('member_left', discord_id, roles=[]))
+        conn.executemany(SQL_DELETE_SNAPSHOT, [(discord_id,) for discord_id in left_ids])
+        conn.executemany(SQL_MARK_RETURNED, [(discord_id,) for discord_id in returned_ids])
+        if job is not None:
+            conn.execute(SQL_SAVE_JOB_STATE, (job, cursor))
+        conn.commit()
+
+def load_job_state(job: str):
+    with get_db('load_job_state') as conn:
+        result = conn.execute(SQL_JOB_STATE, (job,)).fetchone()
+    return result[0] if result else None
+
+def count_audit_entries(discord_id: str):
+    with get_db('count_audit_entries') as conn:
+        return conn.execute(SQL_COUNT_AUDIT_FOR_USER, (discord_id,)).fetchone()[0]
+
+def fetch_audit_page(discord_id: str, before_timestamp: str, before_id: int, limit: int):
+    """Keyset page of a user's (id, action, details, timestamp) audit entries, newest first"""
+    with get_db('fetch_audit_page') as conn:
+        return conn.execute(SQL_AUDIT_PAGE, (discord_id, before_timestamp, before_id, limit)).fetchall()
+
+def archive_audit_batch(cutoff: str, batch_size: int):
+    """
+    Move the oldest audit rows logged before cutoff into a gzipped NDJSON file,
+    then delete them. The file is named after its id range and written before
+    the delete, so a batch interrupted in between is simply rewritten next time.
+    Returns the number of rows archived.
+    """
+    with get_db('archive_audit_batch') as conn:
+        rows = conn.execute(SQL_OLDEST_AUDIT_ROWS, (batch_size,)).fetchall()
+        expired = list(itertools.takewhile(lambda row: (row[4] or '') < cutoff, rows))
+        if not expired:
+            return 0
+        
+        first_id, last_id = expired[0][0], expired[-1][0]
+        os.makedirs(AUDIT_ARCHIVE_DIR, exist_ok=True)
+        path = os.path.join(AUDIT_ARCHIVE_DIR, f'audit_log_{first_id:012d}-{last_id:012d}.ndjson.gz')
+        lines = ''.join(
+            json.dumps({"id": entry_id, "action": action, "discord_id": discord_id,
+                        "details": details, "timestamp": timestamp}) + '\n'
+            for entry_id, action, discord_id, details, timestamp in expired
+        )
+        with open(path + '.tmp', 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                archive.write(lines.encode())
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(path + '.tmp', path)
+        
+        conn.execute(SQL_DELETE_AUDIT_RANGE, (first_id, last_id))
+        conn.commit()
+        return len(expired)
+
+def delete_registration(discord_id: str):
+    """Delete a user's registration, returning the removed account code or None"""
+    with get_db('delete_registration') as conn:
         c = conn.cursor()
+        user_data = c.execute(SQL_ACCOUNT_BY_DISCORD_ID, (discord_id,)).fetchone()
+        if not user_data:
+            return None
+        c.execute(SQL_DELETE_USER, (discord_id,))
+        c.execute(SQL_INSERT_ROLE_CHANGE, change_row('deleted', discord_id, user_data[0]))
+        conn.commit()
+        return user_data[0]
+
+# The account code is looked up by its 16-byte digest. The original code is
+# kept unindexed since admin commands and exports still display it.
+USERS_TABLE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        discord_id TEXT PRIMARY KEY,
+        account_hash BLOB NOT NULL UNIQUE,
+        account_id TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
+        previous_account_id TEXT,
+        left_guild_at DATETIME
+    )
+'''
+
+def migrate_users_to_account_hash(conn: sqlite3.Connection):
+    """Rebuild the users table keyed on account_hash, dropping the duplicate account_id indexes"""
+    logger.info("Migrating users table to account_hash lookup key")
+    conn.create_function('account_digest', 1, account_digest, deterministic=True)
+    c = conn.cursor()
+    c.execute('BEGIN')
+    try:
+        c.execute(USERS_TABLE_SCHEMA.format(table='users_migrated'))
         c.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                discord_id TEXT PRIMARY KEY,
-                account_id TEXT UNIQUE,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
+            INSERT INTO users_migrated (discord_id, account_hash, account_id, timestamp, last_updated)
+            SELECT discord_id, account_digest(account_id), account_id, timestamp, last_updated
+            FROM users WHERE account_id IS NOT NULL
         ''')
+        c.execute('DROP INDEX IF EXISTS idx_account_id')
+        c.execute('DROP TABLE users')
+        c.execute('ALTER TABLE users_migrated RENAME TO users')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # Return the pages of the old table and indexes to the filesystem
+    c.execute('VACUUM')
+    logger.info("users table migration complete")
+
+# Enhanced database setup
+def setup_database():
+    with get_db('setup_database') as conn:
+        c = conn.cursor()
+        c.execute(USERS_TABLE_SCHEMA.format(table='users'))
         
-        # Add index for faster queries
-        c.execute('CREATE INDEX IF NOT EXISTS idx_account_id ON users(account_id)')
+        # Move databases created before account_hash existed to the compact key
+        columns = [row[1] for row in c.execute('PRAGMA table_info(users)')]
+        if 'account_hash' not in columns:
+            migrate_users_to_account_hash(conn)
+            columns = [row[1] for row in c.execute('PRAGMA table_info(users)')]
+        if 'previous_account_id' not in columns:
+            c.execute('ALTER TABLE users ADD COLUMN previous_account_id TEXT')
+        if 'left_guild_at' not in columns:
+            c.execute('ALTER TABLE users ADD COLUMN left_guild_at DATETIME')
         
         # Add audit log table
         c.execute('''
@@ -418,13 +1227,766 @@ def setup_database():
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        
+        # Per-user history for /audit, and lookups by action
+        c.execute('CREATE INDEX IF NOT EXISTS idx_audit_log_discord_id ON audit_log(discord_id, timestamp)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log(action)')
+        
+        # Append-only outbox of role and registration changes, id is the feed cursor
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS role_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event TEXT NOT NULL,
+                discord_id TEXT NOT NULL,
+                account_id TEXT,
+                roles TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Keyset pagination index for /users
+        c.execute('CREATE INDEX IF NOT EXISTS idx_users_timestamp ON users(timestamp, discord_id)')
+        
+        # Daily community points per registered member
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS daily_points (
+                day TEXT NOT NULL,
+                discord_id TEXT NOT NULL,
+                points REAL NOT NULL,
+                PRIMARY KEY (day, discord_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Member role snapshots written by the bot for standalone API workers
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS member_roles (
+                discord_id TEXT PRIMARY KEY,
+                roles TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        columns = [row[1] for row in c.execute('PRAGMA table_info(member_roles)')]
+        if 'version' not in columns:
+            c.execute('ALTER TABLE member_roles ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        
+        # Cursors of resumable background jobs
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS job_state (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
         conn.commit()
 
-# Discord bot setup with enhanced intents
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True  # Enable member intents
-bot = commands.Bot(command_prefix="!", intents=intents)
+# Write-behind batched inserts
+class BatchedWriter:
+    """
+    Queues rows for one INSERT statement and writes them in batches from a
+    background thread. A max_queue_size of 0 makes the queue unbounded. With
+    retry_failed, a batch that fails to write is retried until it succeeds or
+    the writer is stopped, instead of being dropped.
+    """
+    # Queued by stop() to wake the thread, so shutdown never waits out flush_interval
+    _STOP = object()
+
+    def __init__(self, insert_sql: str, name: str, max_queue_size=10000, batch_size=500,
+                 flush_interval=1.0, retry_failed=False):
+        self.insert_sql = insert_sql
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_failed = retry_failed
+        self.flushed = 0
+        self.dropped = 0
+        self._counter_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._queue.put(self._STOP)  # may wait for the writer to make room, never for flush_interval
+        self._thread.join()
+        self._thread = None
+        self._stopping.clear()
+
+    def submit(self, row: tuple):
+        """Queue a row, dropping it if the queue is full. Never blocks the calling thread."""
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "flushed": self.flushed,
+            "dropped": self.dropped
+        }
+
+    def _run(self):
+        while True:
+            batch = []
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if row is self._STOP:
+                    # Everything queued before stop() has been taken by now
+                    stopping = True
+                    break
+                batch.append(row)
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        for attempt in itertools.count(1):
+            try:
+                with get_db(self.name) as conn:
+                    conn.executemany(self.insert_sql, batch)
+                    conn.commit()
+                with self._counter_lock:
+                    self.flushed += len(batch)
+                return
+            except Exception as e:
+                if not self.retry_failed or self._stopping.is_set():
+                    logger.error(f"Error writing {len(batch)} rows from {self.name}, dropping them: {e}", exc_info=True)
+                    with self._counter_lock:
+                        self.dropped += len(batch)
+                    return
+                logger.error(f"Error writing {len(batch)} rows from {self.name}, retrying (attempt {attempt}): {e}")
+                # A stop cuts the backoff short for one last attempt
+                self._stopping.wait(min(0.1 * 2 ** attempt, 5.0))
+
+class AuditLogWriter(BatchedWriter):
+    """Write-behind audit log, bounded so a flood of requests cannot exhaust memory"""
+    def __init__(self, **kwargs):
+        super().__init__(SQL_INSERT_AUDIT_LOG, "audit-log-writer", **kwargs)
+
+    def log(self, action: str, discord_id: Optional[str] = None, details: Optional[str] = None):
+        self.submit((action, discord_id, details, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')))
+
+class ChangeFeedWriter(BatchedWriter):
+    """
+    Appends gateway role and membership events to the role_changes feed.
+    Unbounded and retrying, since a lost change would desync consumers.
+    Registration changes are written in the registration's own transaction instead.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(SQL_INSERT_ROLE_CHANGE, "change-feed-writer", max_queue_size=0, retry_failed=True, **kwargs)
+
+    def record(self, event: str, discord_id: str, account_code: Optional[str] = None, roles=None):
+        self.submit(change_row(event, discord_id, account_code, roles))
+
+change_feed_writer = ChangeFeedWriter(flush_interval=0.5)
+
+audit_log_writer = AuditLogWriter(
+    max_queue_size=int(os.getenv('AUDIT_QUEUE_SIZE', '10000')),
+    batch_size=int(os.getenv('AUDIT_BATCH_SIZE', '500')),
+    flush_interval=float(os.getenv('AUDIT_FLUSH_INTERVAL', '1.0'))
+)
+
+# Group-committed registrations: modal submissions are queued to one writer
+# task, which upserts everything queued so far in a single transaction
+REGISTRATION_BATCH_SIZE = int(os.getenv('REGISTRATION_BATCH_SIZE', '500'))
+
+class RegistrationWriter:
+    """Single asyncio writer task, the only code path that writes registrations from the bot"""
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._queue = asyncio.Queue()
+        self.batches = 0
+        self.written = 0
+
+    async def submit(self, discord_id: str, account_code: str, roles=None):
+        """Queue a registration and wait for its (outcome, previous code)"""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((discord_id, account_code, roles, future))
+        return await future
+
+    async def run(self):
+        while True:
+            # Whatever queued up while the previous batch was committing goes in the next one
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                results = await run_db(
+                    register_accounts, [registration for *registration, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} registrations: {e}", exc_info=True)
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.written += len(batch)
+            for (*_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+registration_writer = RegistrationWriter(REGISTRATION_BATCH_SIZE)
+
+# Audit log retention: rows older than AUDIT_RETENTION_DAYS are moved in
+# batches into compressed files under AUDIT_ARCHIVE_DIR (0 keeps everything)
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', '90'))
+AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', 'audit_archive')
+AUDIT_ARCHIVE_BATCH_SIZE = int(os.getenv('AUDIT_ARCHIVE_BATCH_SIZE', '10000'))
+AUDIT_RETENTION_INTERVAL = float(os.getenv('AUDIT_RETENTION_INTERVAL', '3600'))
+
+# In-memory account code index with a Bloom filter in front of it
+class BloomFilter:
+    """In-process Bloom filter over hashable keys using double hashing"""
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 64)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: bytes):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key: bytes):
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: bytes):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+class AccountIndex:
+    """
+    Maps registered account code digests to discord ids so lookups never touch
+    SQLite. Unregistered codes are rejected by the Bloom filter before the dict lookup.
+    """
+    def __init__(self):
+        self._by_hash = {}
+        self._by_discord_id = {}
+        self._departed = set()
+        self._bloom = BloomFilter(100000)
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._by_hash)
+
+    def load(self):
+        """Build the index from the users table"""
+        with get_db('account_index_load') as conn:
+            rows = conn.execute(SQL_ALL_ACCOUNTS).fetchall()
+            departed = {discord_id for discord_id, in conn.execute(SQL_DEPARTED_USERS)}
+        with self._lock:
+            self._by_hash = dict(rows)
+            self._by_discord_id = {discord_id: account_hash for account_hash, discord_id in rows}
+            self._departed = departed
+            self._rebuild_bloom()
+            self.loaded = True
+        logger.info(f"Account index loaded with {len(rows)} registrations")
+
+    def _rebuild_bloom(self):
+        bloom = BloomFilter(max(len(self._by_hash) * 2, 100000))
+        for account_hash in self._by_hash:
+            bloom.add(account_hash)
+        self._bloom = bloom
+
+    def get(self, account_hash: bytes):
+        """Return the discord_id registered to a code digest, or None"""
+        if account_hash not in self._bloom:
+            return None
+        return self._by_hash.get(account_hash)
+
+    def add(self, discord_id: str, account_hash: bytes):
+        """Record a registration, replacing the user's previous code"""
+        with self._lock:
+            old_hash = self._by_discord_id.pop(discord_id, None)
+            if old_hash is not None:
+                self._by_hash.pop(old_hash, None)
+            self._by_hash[account_hash] = discord_id
+            self._by_discord_id[discord_id] = account_hash
+            if len(self._by_hash) > self._bloom.capacity:
+                self._rebuild_bloom()
+            else:
+                self._bloom.add(account_hash)
+
+    def is_registered(self, discord_id: str):
+        return discord_id in self._by_discord_id
+
+    def account_hash(self, discord_id: str):
+        return self._by_discord_id.get(discord_id)
+
+    def discord_ids(self):
+        with self._lock:
+            return list(self._by_discord_id)
+
+    def has_departed(self, discord_id: str):
+        """True if the registered member is flagged as having left the guild"""
+        return discord_id in self._departed
+
+    def departed_ids(self):
+        with self._lock:
+            return list(self._departed)
+
+    def set_departed(self, discord_id: str, departed: bool):
+        with self._lock:
+            if departed:
+                self._departed.add(discord_id)
+            else:
+                self._departed.discard(discord_id)
+
+    def remove(self, discord_id: str):
+        with self._lock:
+            old_hash = self._by_discord_id.pop(discord_id, None)
+            if old_hash is not None:
+                self._by_hash.pop(old_hash, None)
+            self._departed.discard(discord_id)
+
+account_index = AccountIndex()
+
+def resolve_account_code(account_code: str):
+    """Return the discord_id registered to an account code, or None"""
+    account_hash = account_digest(account_code)
+    if account_index.loaded:
+        return account_index.get(account_hash)
+    with get_db('resolve_account_code') as conn:
+        result = conn.execute(SQL_DISCORD_ID_BY_ACCOUNT, (account_hash,)).fetchone()
+    return result[0] if result else None
+
+def resolve_account_codes(account_codes):
+    """Map each registered account code to its discord_id, skipping unregistered codes"""
+    hashes = {account_digest(code): code for code in account_codes}
+    if account_index.loaded:
+        registered = {}
+        for account_hash, code in hashes.items():
+            discord_id = account_index.get(account_hash)
+            if discord_id is not None:
+                registered[code] = discord_id
+        return registered
+    if not hashes:
+        return {}
+    placeholders = ','.join('?' * len(hashes))
+    with get_db('resolve_account_codes') as conn:
+        rows = conn.execute(
+            f'SELECT account_hash, discord_id FROM users WHERE account_hash IN ({placeholders})',
+            list(hashes)
+        ).fetchall()
+    return {hashes[account_hash]: discord_id for account_hash, discord_id in rows}
+
+async def resolve_account_code_async(account_code: str):
+    """resolve_account_code for the event loop, querying SQLite on the executor if the index is not loaded"""
+    if account_index.loaded:
+        return resolve_account_code(account_code)
+    return await run_db(resolve_account_code, account_code)
+
+async def resolve_account_codes_async(account_codes):
+    if account_index.loaded:
+        return resolve_account_codes(account_codes)
+    return await run_db(resolve_account_codes, account_codes)
+
+# Discord bot setup with enhanced intents
+intents = discord.Intents.default()
+intents.message_content = True
+intents.members = True  # Enable member intents
+bot = commands.Bot(command_prefix="!", intents=intents)
+
+# In-memory member role cache, kept current from gateway events
+# Role versions start at the boot time in milliseconds so they never repeat across restarts
+_role_versions = itertools.count(int(time.time() * 1000))
+
+class MemberRoleCache:
+    """
+    Maps guild member ids to their role ids (excluding @everyone), along with
+    a version that changes whenever the member's roles change. Role changes are
+    passed on to role_index, if given.
+    """
+    def __init__(self, track_changes: bool = False, role_index=None):
+        self._roles = {}
+        self._versions = {}
+        self.track_changes = track_changes
+        self.role_index = role_index
+        self._changed = set()
+        self._removed = set()
+        # Set by load_guild: the next flush prunes snapshots of members no longer cached
+        self.resync = False
+
+    def __len__(self):
+        return len(self._roles)
+
+    def update(self, member: discord.Member):
+        """Store the current roles of a member and return their names"""
+        roles = [role for role in member.roles if role.name != "@everyone"]
+        role_ids = tuple(role.id for role in roles)
+        if self._roles.get(member.id) != role_ids:
+            self._roles[member.id] = role_ids
+            self._versions[member.id] = next(_role_versions)
+            if self.role_index is not None:
+                self.role_index.update(member.id, role_ids)
+        if self.track_changes:
+            self._removed.discard(member.id)
+            self._changed.add(member.id)
+        return [role.name for role in roles]
+
+    def remove(self, member_id: int):
+        self._roles.pop(member_id, None)
+        self._versions.pop(member_id, None)
+        if self.role_index is not None:
+            self.role_index.remove(member_id)
+        if self.track_changes:
+            self._changed.discard(member_id)
+            self._removed.add(member_id)
+
+    def version(self, member_id: int):
+        """Return the member's role version, or None on a cache miss"""
+        return self._versions.get(member_id)
+
+    def role_ids(self, member_id: int):
+        """Return the member's cached role ids, or None on a cache miss"""
+        return self._roles.get(member_id)
+
+    def invalidate_all(self):
+        """Give every cached member a new version, e.g. after a role rename"""
+        self._versions = {member_id: next(_role_versions) for member_id in self._roles}
+        if self.track_changes:
+            self._changed.update(self._roles)
+
+    def drain_changes(self):
+        """Return and reset the (changed, removed) member id sets"""
+        changed, removed = self._changed, self._removed
+        self._changed, self._removed = set(), set()
+        return changed, removed
+
+    def restore_changes(self, changed, removed):
+        """Put drained changes back after a failed write"""
+        self._changed.update(member_id for member_id in changed if member_id not in self._removed)
+        self._removed.update(member_id for member_id in removed if member_id not in self._changed)
+
+    def load_guild(self, guild: discord.Guild):
+        """
+        Replace the cache contents with the guild's chunked member list and
+        return the previous {member id: role ids} contents
+        """
+        previous = self._roles
+        old_ids = previous.keys()
+        self._roles = {
+            member.id: tuple(role.id for role in member.roles if role.name != "@everyone")
+            for member in guild.members
+        }
+        self.invalidate_all()
+        if self.track_changes:
+            # Members who left while the gateway was disconnected
+            self._removed.update(old_ids - self._roles.keys())
+            self.resync = True
+        if self.role_index is not None:
+            self.role_index.rebuild(self._roles)
+        logger.info(f"Member role cache loaded with {len(self._roles)} members")
+        return previous
+
+    def member_ids(self):
+        return list(self._roles)
+
+    def group_by_roles(self, member_ids):
+        """Group cached members by identical role set, skipping members not in the cache"""
+        groups = {}
+        for member_id in member_ids:
+            role_ids = self._roles.get(member_id)
+            if role_ids is not None:
+                groups.setdefault(role_ids, []).append(member_id)
+        return groups
+
+    def role_names(self, guild: discord.Guild, member_id: int):
+        """Return the cached role names of a member, or None on a cache miss"""
+        role_ids = self._roles.get(member_id)
+        if role_ids is None:
+            return None
+        roles = (guild.get_role(role_id) for role_id in role_ids)
+        return [role.name for role in roles if role is not None]
+
+class RoleMemberIndex:
+    """
+    Reverse index from role id to the discord ids of registered members holding
+    it, kept sorted so pages are a bisect and a slice away.
+    """
+    def __init__(self, is_registered):
+        self.is_registered = is_registered
+        self._members = {}  # role id -> sorted list of member ids
+        self._roles = {}  # member id -> indexed role ids
+
+    def update(self, member_id: int, role_ids):
+        """Index a member's current roles, or drop the member if not registered"""
+        if not self.is_registered(member_id):
+            role_ids = ()
+        old_role_ids = self._roles.get(member_id, ())
+        for role_id in set(old_role_ids).difference(role_ids):
+            members = self._members[role_id]
+            del members[bisect.bisect_left(members, member_id)]
+            if not members:
+                del self._members[role_id]
+        for role_id in set(role_ids).difference(old_role_ids):
+            bisect.insort(self._members.setdefault(role_id, []), member_id)
+        if role_ids:
+            self._roles[member_id] = tuple(role_ids)
+        else:
+            self._roles.pop(member_id, None)
+
+    def remove(self, member_id: int):
+        self.update(member_id, ())
+
+    def remove_role(self, role_id: int):
+        for member_id in self._members.pop(role_id, []):
+            role_ids = tuple(r for r in self._roles[member_id] if r != role_id)
+            if role_ids:
+                self._roles[member_id] = role_ids
+            else:
+                del self._roles[member_id]
+
+    def rebuild(self, roles_by_member):
+        """Replace the index with the registered members of a {member id: role ids} map"""
+        members = {}
+        roles = {}
+        for member_id, role_ids in roles_by_member.items():
+            if role_ids and self.is_registered(member_id):
+                roles[member_id] = role_ids
+                for role_id in role_ids:
+                    members.setdefault(role_id, []).append(member_id)
+        for member_ids in members.values():
+            member_ids.sort()
+        self._members = members
+        self._roles = roles
+        logger.info(f"Role member index built for {len(roles)} registered members")
+
+    def count(self, role_id: int):
+        return len(self._members.get(role_id, ()))
+
+    def page(self, role_id: int, after: int, limit: int):
+        """Return up to limit member ids holding the role, in ascending order after the cursor"""
+        members = self._members.get(role_id, [])
+        start = bisect.bisect_right(members, after)
+        return members[start:start + limit]
+
+role_member_index = RoleMemberIndex(lambda member_id: account_index.is_registered(str(member_id)))
+member_role_cache = MemberRoleCache(track_changes=WRITE_ROLE_SNAPSHOTS, role_index=role_member_index)
+
+# Daily community points: each member earns the summed weight of their roles,
+# configured as a JSON object of role name -> points
+ROLE_POINT_WEIGHTS = json.loads(os.getenv('ROLE_POINT_WEIGHTS', '{}'))
+POINTS_RUN_DELAY = float(os.getenv('POINTS_RUN_DELAY', '300'))  # seconds after UTC midnight
+
+def compute_daily_points(guild: discord.Guild, discord_ids):
+    """
+    Points for the given registered members in one pass over the member role
+    cache. Members are grouped by identical role set first, so each distinct set
+    is weighed once. Members missing from the guild are skipped.
+    Returns a list of (discord_id, points).
+    """
+    weights = {role.id: ROLE_POINT_WEIGHTS.get(role.name, 0) for role in guild.roles}
+    groups = member_role_cache.group_by_roles(int(discord_id) for discord_id in discord_ids)
+    rows = []
+    for role_ids, member_ids in groups.items():
+        points = sum(weights.get(role_id, 0) for role_id in role_ids)
+        rows.extend((str(member_id), points) for member_id in member_ids)
+    return rows
+
+def get_registration_guild():
+    """Return the configured guild from the bot's cache"""
+    return bot.get_guild(int(os.getenv('GUILD_ID')))
+
+# Discord REST scheduling. Member fetches from the API, admin commands and
+# bulk jobs share one budget: a global concurrency cap, with waiting calls
+# started in priority order so admin and bulk work cannot starve API lookups
+REST_PRIORITY_API = 0
+REST_PRIORITY_ADMIN = 1
+REST_PRIORITY_BULK = 2
+REST_PRIORITY_NAMES = {REST_PRIORITY_API: 'api', REST_PRIORITY_ADMIN: 'admin', REST_PRIORITY_BULK: 'bulk'}
+DISCORD_REST_CONCURRENCY = int(os.getenv('DISCORD_REST_CONCURRENCY', '8'))
+DISCORD_REST_MAX_RETRIES = int(os.getenv('DISCORD_REST_MAX_RETRIES', '3'))
+
+discord_rest_wait_seconds = Histogram(
+    'discord_rest_wait_seconds', 'Time Discord REST calls waited for a scheduler slot', ('priority',)
+)
+discord_rest_rate_limited = Counter(
+    'discord_rest_rate_limited_total', 'Discord REST calls answered with a 429', ('operation',)
+)
+
+class DiscordRestScheduler:
+    """
+    Runs Discord REST calls with at most max_concurrency in flight. Waiting
+    calls start by priority, FIFO within a priority. A 429 pauses every new
+    call until its retry_after has passed, then the call is retried.
+    """
+    def __init__(self, max_concurrency: int, max_retries: int):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.active = 0
+        self._waiting = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+
+    @property
+    def queue_depth(self):
+        return sum(1 for *_, future in self._waiting if not future.done())
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "queued": self.queue_depth,
+            "paused_for": round(max(self._paused_until - time.monotonic(), 0), 3)
+        }
+
+    async def _acquire(self, priority: int):
+        if self.active < self.max_concurrency and not self._waiting:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # the slot was handed over just as the caller went away
+            raise
+
+    def _release(self):
+        # Hand the slot straight to the next live waiter, skipping cancelled ones
+        while self._waiting:
+            *_, future = heapq.heappop(self._waiting)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    async def run(self, priority: int, operation: str, factory):
+        """Await factory() once a slot is free, recording wait time, latency and outcome"""
+        queued_at = time.perf_counter()
+        await self._acquire(priority)
+        try:
+            discord_rest_wait_seconds.observe(time.perf_counter() - queued_at, REST_PRIORITY_NAMES[priority])
+            for attempt in itertools.count():
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                start = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = await factory()
+                    outcome = 'ok'
+                    return result
+                except discord.NotFound:
+                    outcome = 'not_found'
+                    raise
+                except (discord.RateLimited, discord.HTTPException) as e:
+                    if isinstance(e, discord.HTTPException) and e.status != 429:
+                        raise
+                    outcome = 'rate_limited'
+                    discord_rest_rate_limited.inc(operation)
+                    if attempt >= self.max_retries:
+                        raise
+                    retry_after = getattr(e, 'retry_after', None) or 1.0
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    logger.warning(f"Discord REST {operation} rate limited, pausing for {retry_after:.2f}s")
+                finally:
+                    discord_rest_seconds.observe(time.perf_counter() - start, operation)
+                    discord_rest_requests.inc(operation, outcome)
+        finally:
+            self._release()
+
+rest_scheduler = DiscordRestScheduler(DISCORD_REST_CONCURRENCY, DISCORD_REST_MAX_RETRIES)
+Gauge('discord_rest_queue_depth', 'Discord REST calls waiting for a scheduler slot', lambda: rest_scheduler.queue_depth)
+Gauge('discord_rest_active', 'Discord REST calls in flight', lambda: rest_scheduler.active)
+
+async def fetch_member(guild: discord.Guild, member_id: int, operation: str, priority: int = REST_PRIORITY_API):
+    """guild.fetch_member through the REST scheduler, with metrics recorded under operation"""
+    return await rest_scheduler.run(priority, operation, lambda: guild.fetch_member(member_id))
+
+# Request coalescing for role lookups
+single_flight_calls = Counter(
+    'single_flight_calls_total', 'Calls through a single-flight group, by whether they led or joined a fetch',
+    ('group', 'role')
+)
+not_found_cache_hits = Counter(
+    'not_found_cache_hits_total', 'Role lookups answered 404 from the negative cache', ('detail',)
+)
+
+class SingleFlight:
+    """Concurrent calls for the same key share the first caller's in-flight call"""
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}
+
+    async def run(self, key, factory):
+        future = self._inflight.get(key)
+        if future is not None:
+            single_flight_calls.inc(self.name, 'coalesced')
+        else:
+            single_flight_calls.inc(self.name, 'leader')
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._release(key, done))
+        # A cancelled caller must not cancel the call the others are waiting on
+        return await asyncio.shield(future)
+
+    def _release(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            future.exception()  # retrieved here in case every caller went away
+
+class NegativeCache:
+    """Remembers recent not-found answers for a short TTL"""
+    def __init__(self, ttl: float, max_size: int = 100000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, detail = entry
+        if expires < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return detail
+
+    def add(self, key, detail: str):
+        if len(self._entries) >= self.max_size:
+            now = time.monotonic()
+            self._entries = {k: entry for k, entry in self._entries.items() if entry[0] >= now}
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+        self._entries[key] = (time.monotonic() + self.ttl, detail)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+member_fetches = SingleFlight('member_fetch')
+
+async def fetch_member_shared(guild: discord.Guild, member_id: int, operation: str, priority: int):
+    """
+    fetch_member shared with concurrent fetches of the same member at the same
+    priority, so a lookup never waits behind a lower-priority queued fetch
+    """
+    return await member_fetches.run(
+        (priority, member_id),
+        functools.partial(fetch_member, guild, member_id, operation, priority)
+    )
+not_found_cache = NegativeCache(float(os.getenv('NOT_FOUND_CACHE_TTL', '30')))
 
 # /register Command
 '''
@@ -610,6 +2172,7 @@ async def check(interaction: discord.Interaction):
 
 @bot.tree.command(name="search", description="Search for a user's registration details (Admin only)")
 @app_commands.checks.has_permissions(administrator=True)
+@timed_interaction('search')
 async def search_user(interaction: discord.Interaction, user: discord.User):
     """
     Search for a user's registration details
@@ -618,14 +2181,7 @@ async def search_user(interaction: discord.Interaction, user: discord.User):
     try:
         await interaction.response.defer(ephemeral=True)
         
-        with get_db() as conn:
-            c = conn.cursor()
-            c.execute('''
-                SELECT account_id, timestamp, last_updated 
-                FROM users 
-                WHERE discord_id = ?
-            ''', (str(user.id),))
-            user_data = c.fetchone()
+        user_data = await run_db(lookup_profile, str(user.id))
         
         if not user_data:
             await interaction.followup.send(f"🔍 {user.mention} is not registered in the database.", ephemeral=True)
@@ -634,7 +2190,7 @@ async def search_user(interaction: discord.Interaction, user: discord.User):
         # Fetch user's roles
         guild = interaction.guild
         try:
-            member = await guild.fetch_member(user.id)
+            member = await fetch_member(guild, user.id, 'search', REST_PRIORITY_ADMIN)
             roles = [role.name for role in member.roles if role.name != "@everyone"]
         except discord.NotFound:
             roles = ["User not in server"]
@@ -677,64 +2233,26 @@ async def search_user(interaction: discord.Interaction, user: discord.User):
 
 @bot.tree.command(name="users", description="List all registered users (Admin only)")
 @app_commands.checks.has_permissions(administrator=True)
+@timed_interaction('users')
 async def list_users(interaction: discord.Interaction):
-    """List all registered users with their Vibe Account Codes"""
+    """List all registered users, one page at a time"""
     try:
         await interaction.response.defer(ephemeral=True)
         
-        with get_db() as conn:
-            c = conn.cursor()
-            c.execute('''
-                SELECT discord_id, 
-                       account_id,
-                       timestamp 
-                FROM users 
-                ORDER BY timestamp DESC
-            ''')
-            users = c.fetchall()
+        total = await run_db(count_registered_users)
         
-        if not users:
+        if not total:
             await interaction.followup.send("No users are currently registered.", ephemeral=True)
             return
         
-        max_users_per_message = 20
-        messages = []
-        current_message = "🔍 **Registered Users** 🔍\n\n"
-        current_message += "```\n"
-        current_message += f"{'Username':<30} {'Discord ID':<20} {'Registered On (UTC)'}\n"
-        current_message += "-" * 80 + "\n"
-        
+        # Usernames come from the member cache, chunk the guild once if it is incomplete
         guild = interaction.guild
+        if not guild.chunked:
+            await guild.chunk()
         
-        for discord_id, account_code, timestamp in users:
-            try:
-                member = await guild.fetch_member(int(discord_id))
-                username = member.name if member else "Unknown User"
-            except discord.NotFound:
-                username = "User Left Server"
-            except Exception as e:
-                username = "Fetch Error"
-                logger.error(f"Error fetching user {discord_id}: {e}")
-            
-            truncated_username = (username[:27] + '...') if len(username) > 30 else username
-            
-            user_line = f"{truncated_username:<30} {discord_id:<20} {timestamp}\n"
-            
-            if len(current_message + user_line) > 1900:
-                current_message += "```"
-                messages.append(current_message)
-                current_message = "**Registered Users (continued)** 🔍\n\n"
-                current_message += "```\n"
-                current_message += f"{'Username':<30} {'Discord ID':<20} {'Registered On'}\n"
-                current_message += "-" * 80 + "\n"
-            
-            current_message += user_line
-        
-        current_message += "```"
-        messages.append(current_message)
-        
-        for msg in messages:
-            await interaction.followup.send(msg, ephemeral=True)
+        view = UserListView(interaction.user.id, guild, total)
+        await view.load_page()
+        await interaction.followup.send(view.render(), view=view, ephemeral=True)
         
         logger.info(f"Admin {interaction.user.id} listed all registered users")
     
@@ -744,36 +2262,28 @@ async def list_users(interaction: discord.Interaction):
 
 @bot.tree.command(name="delete", description="Delete a user's registration (Admin only)")
 @app_commands.checks.has_permissions(administrator=True)
+@timed_interaction('delete')
 async def delete_user(interaction: discord.Interaction, user: discord.User):
     """Delete a user's registration from the database"""
     try:
         await interaction.response.defer(ephemeral=True)
         
-        with get_db() as conn:
-            c = conn.cursor()
-            c.execute('SELECT account_id FROM users WHERE discord_id = ?', (str(user.id),))
-            user_data = c.fetchone()
-            
-            if not user_data:
-                await interaction.followup.send(
-                    f"🔍 {user.mention} is not registered in the database.", 
-                    ephemeral=True
-                )
-                return
-            
-            # Delete user from database
-            c.execute('DELETE FROM users WHERE discord_id = ?', (str(user.id),))
-            
-            # Log the deletion in audit log
-            c.execute(
-                'INSERT INTO audit_log (action, discord_id, details) VALUES (?, ?, ?)',
-                ('user_deletion', str(user.id), f'Deleted user: {user.name}')
+        account_code = await run_db(delete_registration, str(user.id))
+        
+        if account_code is None:
+            await interaction.followup.send(
+                f"🔍 {user.mention} is not registered in the database.", 
+                ephemeral=True
             )
-            
-            conn.commit()
+            return
+        
+        account_index.remove(str(user.id))
+        role_member_index.remove(user.id)
+        
+        # Log the deletion in audit log
+        audit_log_writer.log('user_deletion', str(user.id), f'Deleted user: {user.name}')
         
         # Prepare deletion message
-        account_code = user_data[0]
         deletion_info = f"Vibe Account Code: {account_code}"
         
         embed = discord.Embed(
@@ -795,10 +2305,75 @@ async def delete_user(interaction: discord.Interaction, user: discord.User):
         logger.error(f"Error in delete_user command: {str(e)}", exc_info=True)
         await interaction.followup.send(f"An error occurred: {str(e)}", ephemeral=True)
 
-@app.get("/users/{account_code}")
-@limiter.limit("1000/minute")
+@bot.tree.command(name="audit", description="Show a user's audit log history (Admin only)")
+@app_commands.checks.has_permissions(administrator=True)
+@timed_interaction('audit')
+async def audit_user(interaction: discord.Interaction, user: discord.User):
+    """Page through a user's audit log entries, newest first"""
+    try:
+        await interaction.response.defer(ephemeral=True)
+        
+        total = await run_db(count_audit_entries, str(user.id))
+        
+        if not total:
+            await interaction.followup.send(f"📜 No audit log entries for {user.mention}.", ephemeral=True)
+            return
+        
+        view = AuditLogView(interaction.user.id, user, total)
+        await view.load_page()
+        await interaction.followup.send(view.render(), view=view, ephemeral=True)
+        
+        logger.info(f"Admin {interaction.user.id} viewed the audit log of user {user.id}")
+    
+    except Exception as e:
+        logger.error(f"Error in audit_user command: {str(e)}", exc_info=True)
+        await interaction.followup.send(f"An error occurred: {str(e)}", ephemeral=True)
+
+async def get_live_roles(discord_id: str):
+    """
+    Return a member's role names from the cache, falling back to a REST fetch
+    shared with concurrent lookups of the same member. None if not in the guild.
+    """
+    guild = get_registration_guild()
+    if not guild:
+        raise HTTPException(status_code=404, detail="Guild not found")
+
+    roles = member_role_cache.role_names(guild, int(discord_id))
+    if roles is None:
+        # Cache miss, fall back to a REST fetch
+        try:
+            member = await fetch_member_shared(guild, int(discord_id), 'user_roles', REST_PRIORITY_API)
+        except discord.NotFound:
+            member = None
+
+        if not member:
+            return None
+
+        roles = member_role_cache.update(member)
+    return roles
+
+# Conditional GET support for role lookups
+ROLE_CACHE_CONTROL = os.getenv('ROLE_CACHE_CONTROL', 'private, no-cache')
+
+def role_etag(discord_id: str, version: int):
+    return f'W/"{discord_id}-{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str):
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:]
+    return any(
+        candidate.strip().removeprefix('W/') == opaque
+        for candidate in if_none_match.split(',')
+    )
+
+@app.get("/users/{account_code}", dependencies=[Depends(rate_limit("1000/minute"))])
 async def get_user_roles(
     request: Request,
+    response: Response,
     account_code: str,
     api_key: str = Depends(get_api_key)
 ):
@@ -808,52 +2383,170 @@ async def get_user_roles(
         if len(account_code) != 155:
             raise HTTPException(status_code=400, detail="Incorrect code. Be sure to copy it directly from https://vibe.trading/")
             
-        with get_db() as conn:
-            c = conn.cursor()
-            
-            c.execute('SELECT discord_id FROM users WHERE account_id = ?', (account_code,))
-            
-            result = c.fetchone()
-            if not result:
-                raise HTTPException(status_code=404, detail="User not found")
-            
-            discord_id = result[0]
-            
-            # Get user's roles
-            guild = bot.get_guild(int(os.getenv('GUILD_ID')))
-            if not guild:
-                raise HTTPException(status_code=404, detail="Guild not found")
-            
-            # Use run_coroutine_threadsafe for the fetch_member call
-            member = asyncio.run_coroutine_threadsafe(
-                guild.fetch_member(int(discord_id)),
-                bot.loop
-            ).result()
+        # Codes that just returned 404 skip the index, SQLite and Discord
+        account_hash = account_digest(account_code)
+        not_found = not_found_cache.get(account_hash)
+        if not_found:
+            not_found_cache_hits.inc(not_found)
+            raise HTTPException(status_code=404, detail=not_found)
+        
+        discord_id = await resolve_account_code_async(account_code)
+        if not discord_id:
+            not_found_cache.add(account_hash, "User not found")
+            raise HTTPException(status_code=404, detail="User not found")
+        
+        # Members flagged by the reconciler or a leave event skip the role lookup
+        if account_index.has_departed(discord_id):
+            not_found_cache.add(account_hash, "Member not found")
+            raise HTTPException(status_code=404, detail="Member not found")
             
-            if not member:
+        if_none_match = request.headers.get('if-none-match')
+        
+        # Get user's roles
+        if RUN_MODE == 'api':
+            # Standalone workers serve the snapshot published by the bot process
+            snapshot = await run_db(lookup_snapshot_roles, discord_id)
+            if snapshot is None:
+                not_found_cache.add(account_hash, "Member not found")
                 raise HTTPException(status_code=404, detail="Member not found")
-            
-            roles = [role.name for role in member.roles if role.name != "@everyone"]
-            
-            # Log the API request
-            c.execute(
-                'INSERT INTO audit_log (action, discord_id, details) VALUES (?, ?, ?)',
-                ('api_request', discord_id, f'Roles queried for {account_code}')
+            roles, version = snapshot
+        else:
+            # Answer revalidations from the cached version, before any Discord fetch
+            roles = None
+            version = member_role_cache.version(int(discord_id))
+            if version is None or not etag_matches(if_none_match, role_etag(discord_id, version)):
+                roles = await get_live_roles(discord_id)
+                if roles is None:
+                    not_found_cache.add(account_hash, "Member not found")
+                    raise HTTPException(status_code=404, detail="Member not found")
+                version = member_role_cache.version(int(discord_id))
+        
+        etag = role_etag(discord_id, version)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": ROLE_CACHE_CONTROL})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = ROLE_CACHE_CONTROL
+
+        # Log the API request
+        audit_log_writer.log('api_request', discord_id, f'Roles queried for {account_code}')
+        
+        return {
+            "discord_id": discord_id,
+            "roles": roles,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_user_roles: {str(e)}", exc_info=True, extra={"sampled": True})
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def fetch_members(guild: discord.Guild, member_ids, operation: str, priority: int):
+    """Fetch several members over REST, mapping missing members to None"""
+    results = await asyncio.gather(
+        *(fetch_member_shared(guild, member_id, operation, priority) for member_id in member_ids),
+        return_exceptions=True
+    )
+    members = {}
+    for member_id, result in zip(member_ids, results):
+        if isinstance(result, discord.NotFound):
+            members[member_id] = None
+        elif isinstance(result, Exception):
+            raise result
+        else:
+            members[member_id] = result
+    return members
+
+async def get_roles_many(discord_ids):
+    """Map discord ids to role names, or to None for members not in the guild"""
+    if RUN_MODE == 'api':
+        snapshots = await run_db(lookup_snapshot_roles_many, discord_ids)
+        return {discord_id: snapshots.get(discord_id) for discord_id in discord_ids}
+
+    guild = get_registration_guild()
+    if not guild:
+        raise HTTPException(status_code=404, detail="Guild not found")
+
+    # Resolve roles from the member cache, fetching only the misses
+    roles_by_member = {}
+    for discord_id in discord_ids:
+        roles_by_member[discord_id] = member_role_cache.role_names(guild, int(discord_id))
+
+    missing = [
+        int(discord_id) for discord_id, roles in roles_by_member.items()
+        if roles is None and not account_index.has_departed(discord_id)
+    ]
+    if missing:
+        members = await fetch_members(guild, missing, 'batch', REST_PRIORITY_API)
+        for member_id, member in members.items():
+            if member:
+                roles_by_member[str(member_id)] = member_role_cache.update(member)
+    return roles_by_member
+
+@app.post("/users/batch", dependencies=[Depends(rate_limit("100/minute"))])
+async def get_users_roles_batch(
+    request: Request,
+    body: BatchLookupRequest,
+    api_key: str = Depends(get_api_key)
+):
+    """Get Discord roles for several users by Vibe Account Code"""
+    try:
+        account_codes = list(dict.fromkeys(body.account_codes))
+        if not account_codes:
+            raise HTTPException(status_code=400, detail="No account codes provided")
+        if len(account_codes) > BATCH_LOOKUP_MAX_CODES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"At most {BATCH_LOOKUP_MAX_CODES} account codes can be looked up at once"
             )
-            conn.commit()
-            
-            return {
-                "discord_id": discord_id,
-                "roles": roles,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-    
+
+        valid_codes = [code for code in account_codes if len(code) == 155]
+
+        registered = await resolve_account_codes_async(valid_codes)
+        roles_by_member = await get_roles_many(set(registered.values()))
+
+        results = []
+        for code in account_codes:
+            if len(code) != 155:
+                results.append({
+                    "account_code": code,
+                    "status": "invalid",
+                    "detail": "Incorrect code. Be sure to copy it directly from https://vibe.trading/"
+                })
+            elif code not in registered:
+                results.append({"account_code": code, "status": "not_found", "detail": "User not found"})
+            elif roles_by_member[registered[code]] is None:
+                results.append({
+                    "account_code": code,
+                    "status": "not_found",
+                    "discord_id": registered[code],
+                    "detail": "Member not found"
+                })
+            else:
+                results.append({
+                    "account_code": code,
+                    "status": "ok",
+                    "discord_id": registered[code],
+                    "roles": roles_by_member[registered[code]]
+                })
+
+        # Log the API request for every resolved user
+        for code, discord_id in registered.items():
+            audit_log_writer.log('api_request', discord_id, f'Roles queried for {code} (batch)')
+
+        return {
+            "results": results,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in get_user_roles: {str(e)}", exc_info=True)
+        logger.error(f"Error in get_users_roles_batch: {str(e)}", exc_info=True, extra={"sampled": True})
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/user/exists")
-@limiter.limit("1000/minute")
+@app.get("/user/exists", dependencies=[Depends(rate_limit("1000/minute"))])
 async def check_user_existence(
     request: Request,
     account_code: str,
@@ -865,33 +2558,149 @@ async def check_user_existence(
         if len(account_code) != 155:
             raise HTTPException(status_code=400, detail="Incorrect code. Be sure to copy it directly from https://vibe.trading/")
             
-        with get_db() as conn:
-            c = conn.cursor()
-            
-            c.execute('SELECT COUNT(*) FROM users WHERE account_id = ?', (account_code,))
-            
-            result = c.fetchone()
-            user_exists = result[0] > 0
-            
-            # Log the check
-            c.execute(
-                'INSERT INTO audit_log (action, details) VALUES (?, ?)',
-                ('existence_check', f'Checked existence for: {account_code}')
-            )
-            conn.commit()
+        user_exists = await resolve_account_code_async(account_code) is not None
             
-            return {
+        # Log the check
+        audit_log_writer.log('existence_check', None, f'Checked existence for: {account_code}')
+        
+        return {
+            "account_code": account_code,
+            "registered_to_user": user_exists,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in user existence check: {str(e)}", exc_info=True, extra={"sampled": True})
+        raise HTTPException(status_code=500, detail=str(e))
+    
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+
+async def export_registered_users():
+    """Yield NDJSON lines for every registration, one keyset page at a time"""
+    guild = None if RUN_MODE == 'api' else get_registration_guild()
+    after_discord_id = ''
+    while True:
+        rows = await run_db(fetch_export_page, after_discord_id, EXPORT_PAGE_SIZE)
+        if not rows:
+            return
+        lines = []
+        for discord_id, account_code, snapshot in rows:
+            if RUN_MODE == 'api':
+                roles = json.loads(snapshot) if snapshot else None
+            else:
+                roles = member_role_cache.role_names(guild, int(discord_id)) if guild else None
+            lines.append(json.dumps({
+                "discord_id": discord_id,
+                "account_code": account_code,
+                "roles": roles
+            }) + "\n")
+        yield "".join(lines)
+        after_discord_id = rows[-1][0]
+
+@app.get("/export/users", dependencies=[Depends(rate_limit("10/minute"))])
+async def export_users(
+    request: Request,
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Stream every registered user with their current roles as NDJSON.
+    Roles are null for members that are no longer in the guild.
+    """
+    audit_log_writer.log('api_export', None, 'Exported all registered users')
+    return StreamingResponse(export_registered_users(), media_type="application/x-ndjson")
+    
+@app.get("/changes", dependencies=[Depends(rate_limit("600/minute"))])
+async def get_changes(
+    request: Request,
+    since: int = 0,
+    limit: int = 500,
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Page through role and registration changes after a cursor.
+    Pass the returned next_cursor as since to continue.
+    """
+    try:
+        if since < 0 or not 1 <= limit <= 1000:
+            raise HTTPException(status_code=400, detail="since must be >= 0 and limit between 1 and 1000")
+        
+        rows = await run_db(fetch_changes_page, since, limit)
+        changes = [
+            {
+                "cursor": change_id,
+                "event": event,
+                "discord_id": discord_id,
                 "account_code": account_code,
-                "registered_to_user": user_exists,
-                "timestamp": datetime.utcnow().isoformat()
+                "roles": json.loads(roles) if roles is not None else None,
+                "timestamp": created_at
             }
+            for change_id, event, discord_id, account_code, roles, created_at in rows
+        ]
+        
+        return {
+            "changes": changes,
+            "next_cursor": rows[-1][0] if rows else since,
+            "has_more": len(rows) == limit,
+            "timestamp": datetime.utcnow().isoformat()
+        }
     
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in user existence check: {str(e)}", exc_info=True)
+        logger.error(f"Error in get_changes: {str(e)}", exc_info=True, extra={"sampled": True})
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/roles/{role}/members", dependencies=[Depends(rate_limit("600/minute"))])
+async def get_role_members(
+    request: Request,
+    role: str,
+    after: str = '0',
+    limit: int = 1000,
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Page through the registered members holding a role, given by id or exact
+    name, in discord id order. Pass the returned next_cursor as after to continue.
+    """
+    try:
+        if RUN_MODE == 'api':
+            raise HTTPException(status_code=503, detail="Role members are served by the bot process")
+        if not after.isdigit() or not 1 <= limit <= 5000:
+            raise HTTPException(status_code=400, detail="after must be a discord id and limit between 1 and 5000")
+        
+        guild = get_registration_guild()
+        if not guild:
+            raise HTTPException(status_code=404, detail="Guild not found")
+        guild_role = guild.get_role(int(role)) if role.isdigit() else discord.utils.get(guild.roles, name=role)
+        if guild_role is None:
+            raise HTTPException(status_code=404, detail="Role not found")
+        
+        member_ids = [str(member_id) for member_id in role_member_index.page(guild_role.id, int(after), limit)]
+        account_codes = await run_db(lookup_account_codes, member_ids)
+        
+        return {
+            "role": {"id": str(guild_role.id), "name": guild_role.name},
+            "total": role_member_index.count(guild_role.id),
+            "members": [
+                {"discord_id": discord_id, "account_code": account_codes.get(discord_id)}
+                for discord_id in member_ids
+            ],
+            "next_cursor": member_ids[-1] if member_ids else after,
+            "has_more": len(member_ids) == limit,
+            "timestamp": datetime.utcnow().isoformat()
+        }
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_role_members: {str(e)}", exc_info=True, extra={"sampled": True})
+        raise HTTPException(status_code=500, detail=str(e))
+
 @bot.tree.command(name="setup", description="Setup the registration message in this channel (Admin only)")
 @app_commands.checks.has_permissions(administrator=True)
+@timed_interaction('setup')
 async def setup(interaction: discord.Interaction):
     """Setup the registration message with buttons"""
     try:
@@ -934,6 +2743,7 @@ async def setup(interaction: discord.Interaction):
 @search_user.error
 @list_users.error
 @delete_user.error
+@audit_user.error
 async def admin_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
     """Handle permission errors for admin commands"""
     if isinstance(error, app_commands.MissingPermissions):
@@ -942,10 +2752,60 @@ async def admin_command_error(interaction: discord.Interaction, error: app_comma
             ephemeral=True
         )
 
+@app.get("/points", dependencies=[Depends(rate_limit("600/minute"))])
+async def get_daily_points(
+    request: Request,
+    day: Optional[str] = None,
+    after: str = '',
+    limit: int = 1000,
+    api_key: str = Depends(get_api_key)
+):
+    """
+    Page through the daily points of every registered member for a UTC day
+    (YYYY-MM-DD, default today). Pass the returned next_cursor as after to continue.
+    """
+    try:
+        day = day or datetime.utcnow().strftime('%Y-%m-%d')
+        try:
+            datetime.strptime(day, '%Y-%m-%d')
+        except ValueError:
+            raise HTTPException(status_code=400, detail="day must be formatted as YYYY-MM-DD")
+        if not 1 <= limit <= 5000:
+            raise HTTPException(status_code=400, detail="limit must be between 1 and 5000")
+        
+        rows = await run_db(fetch_points_page, day, after, limit)
+        
+        return {
+            "day": day,
+            "points": [
+                {"discord_id": discord_id, "account_code": account_code, "points": points}
+                for discord_id, account_code, points in rows
+            ],
+            "next_cursor": rows[-1][0] if rows else after,
+            "has_more": len(rows) == limit,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_daily_points: {str(e)}", exc_info=True, extra={"sampled": True})
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {
+        "status": "healthy",
+        "audit_log": audit_log_writer.stats(),
+        "discord_rest": rest_scheduler.stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @bot.event
 async def on_ready():
@@ -953,18 +2813,319 @@ async def on_ready():
         logger.info(f'{bot.user} has connected to Discord!')
         logger.info(f'Bot ID: {bot.user.id}')
         
-        # Print out all registered commands
-        commands = await bot.tree.fetch_commands()
-        logger.info("Registered Commands:")
-        for cmd in commands:
-            logger.info(f"- {cmd.name}: {cmd.description}")
-        
-        await bot.tree.sync()
-        logger.info("Command tree synced")
+        # Prime the member role cache from the chunked member list
+        guild = get_registration_guild()
+        if guild:
+            if not guild.chunked:
+                await guild.chunk()
+            # Before the first load in this process, the last published snapshots are the baseline
+            snapshot_roles = await run_db(load_snapshot_roles) if WRITE_ROLE_SNAPSHOTS and not len(member_role_cache) else None
+            previous_roles = member_role_cache.load_guild(guild)
+            await record_missed_changes(guild, previous_roles, snapshot_roles)
+            # Clear flags of members who came back while the bot was offline
+            returned = [discord_id for discord_id in account_index.departed_ids() if guild.get_member(int(discord_id))]
+            if returned:
+                await set_membership([], returned)
+        else:
+            logger.warning("Guild not found, member role cache not loaded")
         
     except Exception as e:
         logger.error(f"Error in on_ready event: {e}", exc_info=True)
 
+@bot.event
+async def on_member_join(member: discord.Member):
+    if member.guild.id == int(os.getenv('GUILD_ID')):
+        member_role_cache.update(member)
+        account_hash = account_index.account_hash(str(member.id))
+        if account_hash:
+            not_found_cache.discard(account_hash)
+            if account_index.has_departed(str(member.id)):
+                await set_membership([], [str(member.id)])
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    if after.guild.id == int(os.getenv('GUILD_ID')) and before.roles != after.roles:
+        roles = member_role_cache.update(after)
+        if account_index.is_registered(str(after.id)):
+            change_feed_writer.record('roles_updated', str(after.id), roles=roles)
+
+@bot.event
+async def on_raw_member_remove(payload: discord.RawMemberRemoveEvent):
+    if payload.guild_id == int(os.getenv('GUILD_ID')):
+        member_role_cache.remove(payload.user.id)
+        if account_index.is_registered(str(payload.user.id)):
+            # Queued behind the member's earlier gateway events, so the feed keeps their order
+            change_feed_writer.record('member_left', str(payload.user.id), roles=[])
+            await set_membership([str(payload.user.id)], [], record_left=False)
+
+@bot.event
+async def on_guild_role_update(before: discord.Role, after: discord.Role):
+    # Role names are part of the lookup response and the snapshots
+    if after.guild.id == int(os.getenv('GUILD_ID')) and before.name != after.name:
+        member_role_cache.invalidate_all()
+
+@bot.event
+async def on_guild_role_delete(role: discord.Role):
+    if role.guild.id == int(os.getenv('GUILD_ID')):
+        role_member_index.remove_role(role.id)
+
+# Long-running bot tasks, referenced here so they are not garbage collected
+background_tasks = set()
+
+def start_background_task(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# Application command sync. setup_hook runs once per process rather than on
+# every reconnect, and a fingerprint of the local command tree saved to disk
+# skips the sync entirely when nothing changed since the last one
+COMMAND_SYNC_STATE_PATH = os.getenv('COMMAND_SYNC_STATE_PATH', 'command_sync.json')
+COMMAND_SYNC_SCOPE = os.getenv('COMMAND_SYNC_SCOPE', 'global')  # 'global', or 'guild' to sync to GUILD_ID instantly
+
+def command_tree_fingerprint(guild: Optional[discord.Object] = None):
+    """Stable hash of the command payloads a sync would upload"""
+    payload = sorted(
+        (command.to_dict(bot.tree) for command in bot.tree.get_commands(guild=guild)),
+        key=lambda command: command['name']
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def load_command_sync_state():
+    try:
+        with open(COMMAND_SYNC_STATE_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_command_sync_state(state):
+    with open(COMMAND_SYNC_STATE_PATH + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(COMMAND_SYNC_STATE_PATH + '.tmp', COMMAND_SYNC_STATE_PATH)
+
+async def sync_command_scope(guild: Optional[discord.Object], state: dict):
+    """Sync one scope (a guild, or global for None) if its tree differs from the last sync"""
+    scope = f"guild:{guild.id}" if guild else "global"
+    state_key = f"{bot.application_id}:{scope}"
+    fingerprint = command_tree_fingerprint(guild)
+    if state.get(state_key) == fingerprint and os.getenv('FORCE_COMMAND_SYNC') != '1':
+        logger.info(f"Command tree unchanged since last sync ({scope}), skipping sync")
+        return
+    
+    synced = await bot.tree.sync(guild=guild)
+    logger.info(f"Command tree synced ({scope}): {', '.join(command.name for command in synced) or 'no commands'}")
+    state[state_key] = fingerprint
+    save_command_sync_state(state)
+
+async def sync_command_tree():
+    """
+    Sync application commands to COMMAND_SYNC_SCOPE, clearing the other scope
+    so commands registered there before do not show up twice
+    """
+    state = load_command_sync_state()
+    guild = discord.Object(int(os.getenv('GUILD_ID')))
+    if COMMAND_SYNC_SCOPE == 'guild':
+        bot.tree.copy_global_to(guild=guild)
+        bot.tree.clear_commands(guild=None)
+        await sync_command_scope(None, state)
+        await sync_command_scope(guild, state)
+    else:
+        await sync_command_scope(None, state)
+        if f"{bot.application_id}:guild:{guild.id}" in state:
+            # Guild copies from an earlier guild-scoped sync, cleared with an empty guild tree
+            await sync_command_scope(guild, state)
+
+@bot.event
+async def setup_hook():
+    # Registration buttons keep working on messages posted before a restart
+    bot.add_view(RegistrationView())
+    start_background_task(registration_writer.run())
+    try:
+        await sync_command_tree()
+    except Exception as e:
+        logger.error(f"Error syncing command tree: {e}", exc_info=True)
+    if WRITE_ROLE_SNAPSHOTS:
+        start_background_task(role_snapshot_loop())
+    if AUDIT_RETENTION_DAYS > 0:
+        start_background_task(audit_retention_loop())
+    if ROLE_POINT_WEIGHTS:
+        start_background_task(daily_points_loop())
+    if RECONCILE_INTERVAL > 0:
+        start_background_task(reconcile_loop())
+
+async def flush_role_snapshots():
+    """Write changed member roles to the member_roles table"""
+    guild = get_registration_guild()
+    if not guild:
+        return
+    resync = member_role_cache.resync
+    member_role_cache.resync = False
+    changed, removed = member_role_cache.drain_changes()
+    rows = []
+    for member_id in changed:
+        roles = member_role_cache.role_names(guild, member_id)
+        if roles is None:
+            removed.add(member_id)
+        else:
+            rows.append((str(member_id), json.dumps(roles), member_role_cache.version(member_id)))
+    if not rows and not removed and not resync:
+        return
+    # After a reload, also drop snapshots of members who left while the bot was offline
+    keep_ids = [str(member_id) for member_id in member_role_cache.member_ids()] if resync else None
+    try:
+        await run_db(write_role_snapshots, rows, [str(member_id) for member_id in removed], keep_ids)
+    except Exception:
+        # Keep the changes for the next flush
+        member_role_cache.restore_changes(changed - removed, removed)
+        member_role_cache.resync = member_role_cache.resync or resync
+        raise
+
+async def role_snapshot_loop():
+    """Continuously publish member role snapshots for standalone API workers"""
+    while not bot.is_closed():
+        await asyncio.sleep(ROLE_SNAPSHOT_INTERVAL)
+        try:
+            await flush_role_snapshots()
+        except Exception as e:
+            logger.error(f"Error writing member role snapshots: {e}", exc_info=True)
+
+async def award_daily_points(day: str):
+    """Compute and store every registered member's points for a day"""
+    guild = get_registration_guild()
+    start = time.perf_counter()
+    rows = compute_daily_points(guild, account_index.discord_ids())
+    await run_db(write_daily_points, day, rows)
+    logger.info(f"Awarded daily points for {day} to {len(rows)} members in {time.perf_counter() - start:.2f}s")
+
+async def daily_points_loop():
+    """Award each UTC day's points once the member cache is loaded, then wait for the next day"""
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            guild = get_registration_guild()
+            if not guild or not guild.chunked:
+                # on_ready has not loaded the member role cache yet
+                await asyncio.sleep(10)
+                continue
+            day = datetime.utcnow().strftime('%Y-%m-%d')
+            if not await run_db(daily_points_exist, day):
+                await award_daily_points(day)
+        except Exception as e:
+            logger.error(f"Error computing daily points: {e}", exc_info=True)
+        now = datetime.utcnow()
+        next_run = datetime(now.year, now.month, now.day) + timedelta(days=1, seconds=POINTS_RUN_DELAY)
+        await asyncio.sleep((next_run - now).total_seconds())
+
+async def audit_retention_loop():
+    """Periodically archive expired audit log rows, one short transaction per batch"""
+    while not bot.is_closed():
+        try:
+            cutoff = (datetime.utcnow() - timedelta(days=AUDIT_RETENTION_DAYS)).strftime('%Y-%m-%d %H:%M:%S')
+            archived = 0
+            while True:
+                count = await run_db(archive_audit_batch, cutoff, AUDIT_ARCHIVE_BATCH_SIZE)
+                archived += count
+                if count < AUDIT_ARCHIVE_BATCH_SIZE:
+                    break
+            if archived:
+                logger.info(f"Archived {archived} audit log entries older than {cutoff} to {AUDIT_ARCHIVE_DIR}")
+        except Exception as e:
+            logger.error(f"Error archiving audit log: {e}", exc_info=True)
+        await asyncio.sleep(AUDIT_RETENTION_INTERVAL)
+
+# Membership reconciliation. Walks the users table in discord id order and
+# flags registered members who are no longer in the guild, so lookups for
+# them answer without a failing Discord fetch. The cursor survives restarts.
+RECONCILE_JOB = 'membership_reconcile'
+RECONCILE_INTERVAL = float(os.getenv('RECONCILE_INTERVAL', '5'))  # seconds between chunks, 0 disables
+RECONCILE_CHUNK_SIZE = int(os.getenv('RECONCILE_CHUNK_SIZE', '500'))
+RECONCILE_PASS_INTERVAL = float(os.getenv('RECONCILE_PASS_INTERVAL', '3600'))
+
+membership_changes = Counter(
+    'membership_changes_total', 'Registered members flagged as left or returned', ('change',)
+)
+
+async def set_membership(left_ids, returned_ids, cursor: Optional[str] = None, changes=(), record_left: bool = True):
+    """Persist membership flags (and the reconcile cursor, if given), then update the account index"""
+    await run_db(
+        mark_membership, left_ids, returned_ids, RECONCILE_JOB if cursor is not None else None, cursor,
+        changes, record_left
+    )
+    for discord_id in left_ids:
+        account_index.set_departed(discord_id, True)
+    for discord_id in returned_ids:
+        account_index.set_departed(discord_id, False)
+    membership_changes.inc('left', amount=len(left_ids))
+    membership_changes.inc('returned', amount=len(returned_ids))
+
+async def record_missed_changes(guild: discord.Guild, previous_roles, snapshot_roles=None):
+    """
+    Feed the role changes and departures of registered members that happened
+    while the bot was disconnected or offline. The baseline is the member
+    cache before the reload, or the published snapshots after a restart.
+    """
+    if previous_roles:
+        baseline = {}
+        for member_id, role_ids in previous_roles.items():
+            roles = (guild.get_role(role_id) for role_id in role_ids)
+            baseline[str(member_id)] = [role.name for role in roles if role is not None]
+    else:
+        baseline = snapshot_roles or {}
+    left = []
+    changes = []
+    for discord_id in account_index.discord_ids():
+        if discord_id not in baseline or account_index.has_departed(discord_id):
+            continue
+        roles = member_role_cache.role_names(guild, int(discord_id))
+        if roles is None:
+            left.append(discord_id)
+        elif set(roles) != set(baseline[discord_id]):
+            changes.append(change_row('roles_updated', discord_id, roles=roles))
+    if left or changes:
+        await set_membership(left, [], changes=changes)
+        logger.info(f"Recorded {len(changes)} role changes and {len(left)} departures missed while disconnected")
+
+async def reconcile_chunk(guild: discord.Guild, after: str):
+    """
+    Reconcile the next RECONCILE_CHUNK_SIZE registrations after the cursor and
+    return the new cursor, '' once the pass is complete.
+    """
+    rows = await run_db(fetch_reconcile_page, after, RECONCILE_CHUNK_SIZE)
+    if guild.chunked:
+        # The chunked member list is kept current by gateway events
+        present = {discord_id for discord_id, _ in rows if guild.get_member(int(discord_id))}
+    else:
+        members = await fetch_members(guild, [int(discord_id) for discord_id, _ in rows], 'reconcile', REST_PRIORITY_BULK)
+        present = set()
+        for member_id, member in members.items():
+            if member:
+                member_role_cache.update(member)
+                present.add(str(member_id))
+    left = [discord_id for discord_id, departed in rows if not departed and discord_id not in present]
+    returned = [discord_id for discord_id, departed in rows if departed and discord_id in present]
+    cursor = rows[-1][0] if len(rows) == RECONCILE_CHUNK_SIZE else ''
+    await set_membership(left, returned, cursor)
+    if left or returned:
+        logger.info(f"Membership reconcile flagged {len(left)} departed and {len(returned)} returned members")
+    return cursor
+
+async def reconcile_loop():
+    """Reconcile one chunk every RECONCILE_INTERVAL seconds, resting RECONCILE_PASS_INTERVAL between passes"""
+    await bot.wait_until_ready()
+    cursor = await run_db(load_job_state, RECONCILE_JOB) or ''
+    while not bot.is_closed():
+        delay = RECONCILE_INTERVAL
+        try:
+            guild = get_registration_guild()
+            if guild:
+                cursor = await reconcile_chunk(guild, cursor)
+                if cursor == '':
+                    delay = RECONCILE_PASS_INTERVAL
+        except Exception as e:
+            logger.error(f"Error reconciling guild membership: {e}", exc_info=True)
+        await asyncio.sleep(delay)
+
 async def run_bot():
     """Run the Discord bot"""
     try:
@@ -972,30 +3133,61 @@ async def run_bot():
     except Exception as e:
         logger.error(f"Bot error: {e}", exc_info=True)
 
-def run_api():
-    """Run the FastAPI server"""
-    uvicorn.run(
+async def run_api():
+    """Serve the FastAPI app on the running loop, next to the bot"""
+    config = uvicorn.Config(
         app,
         host="0.0.0.0",
         port=int(os.getenv('PORT', '8000')),
         ssl_keyfile=os.getenv('SSL_KEYFILE'),
-        ssl_certfile=os.getenv('SSL_CERTFILE')
+        ssl_certfile=os.getenv('SSL_CERTFILE'),
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv('FORWARDED_ALLOW_IPS', '127.0.0.1'),
+        # Keep uvicorn's loggers unconfigured so they propagate to the root queue handler
+        log_config=None
     )
+    global api_server
+    api_server = uvicorn.Server(config)
+    await api_server.serve()
+
+# Set by run_api, so a shutdown signal can stop the in-loop API server
+api_server = None
+
+def request_shutdown():
+    """
+    SIGTERM/SIGINT handler: stop the API server and close the bot, so main()
+    returns normally and flushes the writers. While serving, uvicorn takes the
+    signal first and re-raises it once it has shut down, which lands here.
+    """
+    logger.info("Shutdown requested")
+    if api_server is not None:
+        api_server.should_exit = True
+    start_background_task(bot.close())
 
 async def main():
     """Main function to run both bot and API"""
     setup_database()
+    account_index.load()
+    audit_log_writer.start()
+    change_feed_writer.start()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, request_shutdown)
     
-    # Create task for API
-    api_task = asyncio.create_task(
-        asyncio.to_thread(run_api)
-    )
-    
-    # Run both concurrently
-    await asyncio.gather(
-        run_bot(),
-        api_task
-    )
+    try:
+        if RUN_MODE == 'bot':
+            # The API is served separately by api.py
+            await run_bot()
+        else:
+            # Bot and API share this loop, so API handlers await Discord calls directly
+            await asyncio.gather(
+                run_bot(),
+                run_api()
+            )
+    finally:
+        # Flush queued audit entries and changes before exiting
+        audit_log_writer.stop()
+        change_feed_writer.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file